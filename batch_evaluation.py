@@ -0,0 +1,75 @@
+import numpy as np
+
+import evaluation
+from board import PIECE_VALUES
+
+# Evaluates many positions at once. A position is given by its position_key (4 bits per playable square),
+# which doesn't fit into a NumPy integer, so it's packed as two uint64: squares 0-15 and squares 16-31.
+
+LOW_MASK = (1 << 64) - 1
+NIBBLE_SHIFTS = np.arange(16, dtype=np.uint64) * np.uint64(4)
+SQUARES = np.arange(32)
+
+_value_table = None  # [piece representation, square] -> material and positional value in hundredths of a man
+_value_table_version = None  # evaluation.weights_version the table was made with
+
+
+def value_table():
+    """
+    :return: array of shape (16, 32): value of piece standing on the square (the same as Board uses),
+             0 for empty square
+    """
+    global _value_table, _value_table_version
+    if _value_table_version != evaluation.weights_version:
+        _value_table = np.array(evaluation.POSITIONAL_TABLE, dtype=np.int64)
+        for representation, value in PIECE_VALUES.items():
+            _value_table[representation] += value * 10
+        _value_table_version = evaluation.weights_version
+    return _value_table
+
+
+def pack_position_keys(position_keys):
+    """
+    :param position_keys: iterable of position_key of boards
+    :return: array of shape (positions, 2) of uint64
+    """
+    position_keys = list(position_keys)
+    packed = np.empty((len(position_keys), 2), dtype=np.uint64)
+    packed[:, 0] = np.fromiter((position_key & LOW_MASK for position_key in position_keys), dtype=np.uint64,
+                               count=len(position_keys))
+    packed[:, 1] = np.fromiter((position_key >> 64 for position_key in position_keys), dtype=np.uint64,
+                               count=len(position_keys))
+    return packed
+
+
+def unpack_squares(packed):
+    """
+    :param packed: array made by pack_position_keys
+    :return: array of shape (positions, 32) of piece representations (0 for empty square)
+    """
+    return ((packed[:, :, np.newaxis] >> NIBBLE_SHIFTS) & np.uint64(0xF)).reshape(len(packed), 32).astype(np.uint8)
+
+
+def evaluate_batch(packed):
+    """
+    :param packed: array made by pack_position_keys
+    :return: array of balance of every position (equal to Board.balance)
+    """
+    return value_table()[unpack_squares(packed), SQUARES].sum(axis=1) / 100
+
+
+def evaluate_position_keys(position_keys):
+    """
+    :return: array of balance of every position
+    """
+    return evaluate_batch(pack_position_keys(position_keys))
+
+
+def evaluate_corpus(position_keys, batch_size=1 << 16):
+    """
+    Scores any number of stored positions keeping only batch_size of them unpacked at once
+    :return: array of balance of every position
+    """
+    position_keys = list(position_keys)
+    return np.concatenate([evaluate_position_keys(position_keys[start:start + batch_size])
+                           for start in range(0, len(position_keys), batch_size)] or [np.empty(0)])
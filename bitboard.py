@@ -0,0 +1,454 @@
+from itertools import product
+
+from board import *
+
+# Only the 32 dark cells are playable, so a position fits in three 32-bit masks (white, black, kings).
+# Square number = row * 4 + column // 2, e.g. (0,1) -> 0, (0,7) -> 3, (1,0) -> 4, (7,6) -> 31
+SQUARE_CELLS = [(row, column) for row in range(8) for column in range(8) if is_allowed_cell_on_board(row, column)]
+CELL_SQUARES = {cell: square for square, cell in enumerate(SQUARE_CELLS)}
+ALL_SQUARES = 0xFFFFFFFF
+
+# directions as (delta_row, delta_column); white men move toward row 0, black men toward row 7
+DIAGONALS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+WHITE_FORWARD = (0, 1)
+BLACK_FORWARD = (2, 3)
+WHITE_PROMOTION_SQUARES = 0x0000000F  # row 0
+BLACK_PROMOTION_SQUARES = 0xF0000000  # row 7
+
+
+def _build_rays():
+    """
+    For every square and every diagonal: squares met when going that way, nearest first
+    :return: rays[square][direction] -> tuple of squares
+    """
+    rays = []
+    for row, column in SQUARE_CELLS:
+        square_rays = []
+        for delta_row, delta_column in DIAGONALS:
+            ray = []
+            ray_row, ray_column = row + delta_row, column + delta_column
+            while is_allowed_cell_on_board(ray_row, ray_column):
+                ray.append(CELL_SQUARES[(ray_row, ray_column)])
+                ray_row += delta_row
+                ray_column += delta_column
+            square_rays.append(tuple(ray))
+        rays.append(tuple(square_rays))
+    return tuple(rays)
+
+
+RAYS = _build_rays()
+
+
+def squares_of(mask):
+    """
+    :return: numbers of squares set in the mask, ascending
+    """
+    while mask:
+        lowest = mask & -mask
+        yield lowest.bit_length() - 1
+        mask ^= lowest
+
+
+def count_squares(mask):
+    return bin(mask).count("1")
+
+
+def _build_row_bitboards():
+    """
+    A row of the board is 4 squares - 16 bits of position_key
+    :return: dict 16 bits of position_key -> (white, black, kings) masks of the 4 squares
+    """
+    row_bitboards = {}
+    for representations in product((0x0, 0x2, 0x3, 0xa, 0xb), repeat=4):
+        row_key = white = black = kings = 0
+        for index, representation in enumerate(representations):
+            row_key |= representation << (4 * index)
+            if representation:
+                if representation < 0xa:
+                    white |= 1 << index
+                else:
+                    black |= 1 << index
+                if representation & 0x1:
+                    kings |= 1 << index
+        row_bitboards[row_key] = (white, black, kings)
+    return row_bitboards
+
+
+ROW_BITBOARDS = _build_row_bitboards()
+
+
+def bitboards_from_position_key(position_key):
+    """
+    :return: (white, black, kings) masks of the position
+    """
+    white = black = kings = 0
+    for row in range(8):
+        row_white, row_black, row_kings = ROW_BITBOARDS[(position_key >> (16 * row)) & 0xFFFF]
+        white |= row_white << (4 * row)
+        black |= row_black << (4 * row)
+        kings |= row_kings << (4 * row)
+    return white, black, kings
+
+
+class BitBoard:
+    """
+    Drop-in replacement for Board keeping the position as 32-square bitboards.
+    Successors are produced with integer operations only - no Piece objects are ever created.
+    """
+
+    def __init__(self, board_repr=INITIAL_BOARD_REPR, next_turn=Color.WHITE, level=0):
+        """
+        :type board_repr: Memory optimized representation of board (the same one Board uses)
+        """
+        self.turn = next_turn
+        self.level = level
+        self.last_move = None
+        self.position_key = position_key_from_board_repr(board_repr)
+        self.white, self.black, self.kings = bitboards_from_position_key(self.position_key)
+        self.zobrist_hash = self._compute_zobrist_hash()
+        self.positional = self._compute_positional()
+        self._generated_moves = None  # cached by _generate_moves until the position changes
+        self._legal_moves = None  # cached by get_legal_moves until the position changes
+
+    @classmethod
+    def from_bitboards(cls, white, black, kings, next_turn=Color.WHITE, level=0, zobrist_hash=None,
+                       position_key=None, positional=None):
+        """
+        :param zobrist_hash: hash of the position if already known (computed from scratch otherwise)
+        :param position_key: packed position if already known (computed from scratch otherwise)
+        :param positional: positional score if already known (computed from scratch otherwise)
+        """
+        board = cls.__new__(cls)
+        board.turn = next_turn
+        board.level = level
+        board.last_move = None
+        board.white = white
+        board.black = black
+        board.kings = kings
+        board.zobrist_hash = board._compute_zobrist_hash() if zobrist_hash is None else zobrist_hash
+        board.position_key = board._compute_position_key() if position_key is None else position_key
+        board.positional = board._compute_positional() if positional is None else positional
+        board._generated_moves = None
+        board._legal_moves = None
+        return board
+
+    @classmethod
+    def from_position_key(cls, position_key, next_turn=Color.WHITE, level=0):
+        """
+        :param position_key: packed position - the position_key attribute of a board (Board or BitBoard)
+        """
+        white, black, kings = bitboards_from_position_key(position_key)
+        return cls.from_bitboards(white, black, kings, next_turn, level, position_key=position_key)
+
+    def _compute_zobrist_hash(self):
+        result = ZOBRIST_BLACK_TO_MOVE if self.turn == Color.BLACK else 0
+        for square in squares_of(self.white | self.black):
+            result ^= ZOBRIST_PIECE_KEYS[self._representation_at(square)][square]
+        return result
+
+    def _compute_position_key(self):
+        result = 0
+        for square in squares_of(self.white | self.black):
+            result |= self._representation_at(square) << (4 * square)
+        return result
+
+    def _compute_positional(self):
+        result = 0
+        for square in squares_of(self.white | self.black):
+            result += POSITIONAL_TABLE[self._representation_at(square)][square]
+        return result
+
+    def _representation_at(self, square):
+        """
+        :return: representation of the piece standing on the square (the same as Piece.get_representation)
+        """
+        bit = 1 << square
+        if self.white & bit:
+            return 0x3 if self.kings & bit else 0x2
+        return 0xb if self.kings & bit else 0xa
+
+    @property
+    def board_repr(self):
+        """
+        :return: Memory optimized representation of that board (compatible with Board)
+        """
+        return board_repr_from_position_key(self.position_key)
+
+    @property
+    def balance(self):
+        """
+        :return: Positive balance means white is winning
+        """
+        men = ~self.kings
+        material = PIECE_VALUES[0x2] * (count_squares(self.white & men) - count_squares(self.black & men)) \
+            + PIECE_VALUES[0x3] * (count_squares(self.white & self.kings) - count_squares(self.black & self.kings))
+        return (material * 10 + self.positional) / 100
+
+    def count_pieces_of_color(self, color):
+        return count_squares(self.white if color == Color.WHITE else self.black)
+
+    def get_next_boards(self):
+        """
+        Generates all possible boards reachable from the current one in a single turn
+        :return: list of new BitBoards (next level, next turn)
+        """
+        return [self._get_board_after(from_square, to_square, captured)
+                for from_square, to_square, captured, _ in self._generate_moves()]
+
+    def iter_next_boards(self):
+        """
+        Lazy version of get_next_boards - every board is created only when it's requested
+        :return: generator of new BitBoards (next level, next turn)
+        """
+        for from_square, to_square, captured, _ in self._generate_moves():
+            yield self._get_board_after(from_square, to_square, captured)
+
+    def get_board_after(self, move):
+        """
+        :param move: Move generated by get_legal_moves
+        :return: new BitBoard (next level, next turn) with the move made, this one stays unchanged
+        """
+        board = self.copy()
+        board.make_move(move)
+        return board
+
+    def get_legal_moves(self):
+        """
+        The result is kept until the position changes (don't modify it)
+        :return: list of Moves in the same order get_next_boards generates boards
+        """
+        if self._legal_moves is not None:
+            return self._legal_moves
+        moves = []
+        promotion_squares = WHITE_PROMOTION_SQUARES if self.turn == Color.WHITE else BLACK_PROMOTION_SQUARES
+        for from_square, to_square, captured, hops in self._generate_moves():
+            promotion = not (self.kings >> from_square & 1) and bool(promotion_squares >> to_square & 1)
+            moves.append(Move(SQUARE_CELLS[from_square], SQUARE_CELLS[to_square], len(hops), promotion,
+                              tuple(SQUARE_CELLS[landing] for _, landing in hops),
+                              tuple(SQUARE_CELLS[captured_square] for captured_square, _ in hops), captured))
+        self._legal_moves = moves
+        return moves
+
+    def make_move(self, move):
+        """
+        Performs the move on this board (changes turn and level too)
+        :param move: Move generated by get_legal_moves
+        :return: record needed by unmake_move to revert the move
+        """
+        record = (self.white, self.black, self.kings, self.zobrist_hash, self.position_key, self.positional,
+                  self.last_move, self._generated_moves, self._legal_moves)
+        captured = 0
+        for cell in move.captured:
+            captured |= 1 << CELL_SQUARES[cell]
+        self.white, self.black, self.kings, self.zobrist_hash, self.position_key, self.positional, _ = \
+            self._position_after(CELL_SQUARES[move.start], CELL_SQUARES[move.end], captured)
+        self.last_move = move
+        self._generated_moves = None
+        self._legal_moves = None
+        self.level += 1
+        self.turn = Color.BLACK if self.turn == Color.WHITE else Color.WHITE
+        return record
+
+    def unmake_move(self, move, record):
+        """
+        Reverts the move done by make_move
+        :param record: value returned by make_move
+        :return: -
+        """
+        self.white, self.black, self.kings, self.zobrist_hash, self.position_key, self.positional, \
+            self.last_move, self._generated_moves, self._legal_moves = record
+        self.level -= 1
+        self.turn = Color.BLACK if self.turn == Color.WHITE else Color.WHITE
+
+    def copy(self):
+        board = BitBoard.from_bitboards(self.white, self.black, self.kings, self.turn, self.level, self.zobrist_hash,
+                                        self.position_key, self.positional)
+        board.last_move = self.last_move
+        return board
+
+    def _generate_moves(self):
+        """
+        The result is kept until the position changes - game end detection and generation of boards or moves
+        of the same position share it
+        :return: list of (from_square, to_square, captured mask, hops) where hops are (captured_square, landing),
+                 attacks reaching the same position by jumping in different order are returned once
+        """
+        if self._generated_moves is not None:
+            return self._generated_moves
+        if self.turn == Color.WHITE:
+            own, opponent = self.white, self.black
+        else:
+            own, opponent = self.black, self.white
+
+        results = []
+        for square in squares_of(own):
+            is_king = self.kings >> square & 1
+            others = own & ~(1 << square)
+            hops = _attack_hops(square, is_king, others, opponent)
+            if hops:
+                _collect_attack_chains(square, hops, is_king, others, opponent, 0, (), results, set())
+
+        if not results:  # attacks are obligatory - move only if nobody can attack
+            empty = ALL_SQUARES & ~(self.white | self.black)
+            forward = WHITE_FORWARD if self.turn == Color.WHITE else BLACK_FORWARD
+            for square in squares_of(own):
+                if self.kings >> square & 1:
+                    for ray in RAYS[square]:
+                        for target in ray:
+                            if not empty >> target & 1:
+                                break
+                            results.append((square, target, 0, ()))
+                else:
+                    for direction in forward:
+                        ray = RAYS[square][direction]
+                        if ray and empty >> ray[0] & 1:
+                            results.append((square, ray[0], 0, ()))
+        self._generated_moves = results
+        return results
+
+    def _get_board_after(self, from_square, to_square, captured):
+        """
+        Universal method to move one piece (removing captured ones). It's not validating movements!
+        :return: new BitBoard for the next turn
+        """
+        white, black, kings, zobrist_hash, position_key, positional, promotion = \
+            self._position_after(from_square, to_square, captured)
+        board = BitBoard.from_bitboards(white, black, kings, Color.BLACK if self.turn == Color.WHITE else Color.WHITE,
+                                        self.level + 1, zobrist_hash, position_key, positional)
+        board.last_move = Move(SQUARE_CELLS[from_square], SQUARE_CELLS[to_square], count_squares(captured),
+                               promotion, captured_mask=captured)
+        return board
+
+    def _position_after(self, from_square, to_square, captured):
+        """
+        :return: (white, black, kings, zobrist_hash, position_key, positional, promotion) after moving the piece
+                 of the player to move
+        """
+        from_bit = 1 << from_square
+        to_bit = 1 << to_square
+        moved_representation = self._representation_at(from_square)
+        zobrist_hash = self.zobrist_hash ^ ZOBRIST_BLACK_TO_MOVE \
+            ^ ZOBRIST_PIECE_KEYS[moved_representation][from_square]
+        position_key = self.position_key ^ (moved_representation << (4 * from_square))
+        positional = self.positional - POSITIONAL_TABLE[moved_representation][from_square]
+        for captured_square in squares_of(captured):
+            captured_representation = self._representation_at(captured_square)
+            zobrist_hash ^= ZOBRIST_PIECE_KEYS[captured_representation][captured_square]
+            position_key ^= captured_representation << (4 * captured_square)
+            positional -= POSITIONAL_TABLE[captured_representation][captured_square]
+
+        promotion = False
+        kings = self.kings & ~captured
+        if kings & from_bit:
+            kings = (kings & ~from_bit) | to_bit
+        elif to_bit & (WHITE_PROMOTION_SQUARES if self.turn == Color.WHITE else BLACK_PROMOTION_SQUARES):
+            kings |= to_bit
+            moved_representation += 1  # man -> king (2 -> 3, a -> b)
+            promotion = True
+        zobrist_hash ^= ZOBRIST_PIECE_KEYS[moved_representation][to_square]
+        position_key ^= moved_representation << (4 * to_square)
+        positional += POSITIONAL_TABLE[moved_representation][to_square]
+
+        if self.turn == Color.WHITE:
+            return (self.white & ~from_bit) | to_bit, self.black & ~captured, kings, zobrist_hash, position_key, \
+                positional, promotion
+        return self.white & ~captured, (self.black & ~from_bit) | to_bit, kings, zobrist_hash, position_key, \
+            positional, promotion
+
+    def did_game_end(self):
+        """
+        Defines if state is terminal or not
+        :return: true/false
+        """
+        if self.turn == Color.WHITE:
+            own, opponent = self.white, self.black
+        else:
+            own, opponent = self.black, self.white
+
+        if not own:  # if you have no pieces left its game over
+            return True
+        if self._generated_moves is not None:
+            return not self._generated_moves
+
+        empty = ALL_SQUARES & ~(self.white | self.black)
+        for square in squares_of(own):
+            is_king = self.kings >> square & 1
+            directions = range(4) if is_king else (WHITE_FORWARD if self.turn == Color.WHITE else BLACK_FORWARD)
+            for direction in directions:
+                ray = RAYS[square][direction]
+                if ray and empty >> ray[0] & 1:
+                    return False
+            if _attack_hops(square, is_king, own & ~(1 << square), opponent):
+                return False
+        return True
+
+    def next_level(self):
+        """
+        Changes deepness level in tree structure
+        :return:
+        """
+        self.level += 1
+
+    def next_turn(self):
+        """
+        Changes turn of current state
+        :return: -
+        """
+        if self.turn == Color.BLACK:
+            self.turn = Color.WHITE
+        else:
+            self.turn = Color.BLACK
+        self.zobrist_hash ^= ZOBRIST_BLACK_TO_MOVE
+        self._generated_moves = None
+        self._legal_moves = None
+
+    def __str__(self):
+        return Board(self.board_repr, self.turn, self.level).__str__()
+
+
+BOARD_CLASSES.append(BitBoard)
+
+
+def _attack_hops(square, is_king, others, opponent):
+    """
+    Single attacks available for a piece standing on the square
+    :param others: pieces of the attacker's color except the attacking one
+    :param opponent: pieces that can be captured
+    :return: list of (captured bit, square after attack)
+    """
+    occupied = others | opponent
+    hops = []
+    for ray in RAYS[square]:
+        if is_king:
+            distance = 0
+            while distance < len(ray) and not occupied >> ray[distance] & 1:
+                distance += 1
+            if distance >= len(ray) - 1 or not opponent >> ray[distance] & 1:
+                continue
+            captured_bit = 1 << ray[distance]
+            for landing in ray[distance + 1:]:
+                if occupied >> landing & 1:
+                    break
+                hops.append((captured_bit, landing))
+        elif len(ray) > 1 and opponent >> ray[0] & 1 and not occupied >> ray[1] & 1:
+            hops.append((1 << ray[0], ray[1]))
+    return hops
+
+
+def _collect_attack_chains(from_square, hops, is_king, others, opponent, captured, chain, results, finished):
+    """
+    Follows multiple-attacks to their ends, appending (from_square, to_square, captured mask, chain) of each one.
+    A man is not crowned until its attack is over.
+    :param chain: (captured_square, landing) of attacks done so far
+    :param finished: (to_square, captured mask) of attacks of the piece already appended to results
+    """
+    for captured_bit, landing in hops:
+        remaining = opponent & ~captured_bit
+        next_chain = chain + ((captured_bit.bit_length() - 1, landing),)
+        next_hops = _attack_hops(landing, is_king, others, remaining)
+        if next_hops:
+            _collect_attack_chains(from_square, next_hops, is_king, others, remaining, captured | captured_bit,
+                                   next_chain, results, finished)
+        elif (landing, captured | captured_bit) not in finished:
+            finished.add((landing, captured | captured_bit))
+            results.append((from_square, landing, captured | captured_bit, next_chain))
@@ -1,61 +1,119 @@
 from typing import List, Any, Union
 
 from piece import *
+from move import Move
+from zobrist import *
+from evaluation import BOARD_CLASSES, POSITIONAL_TABLE
+
+
+INITIAL_BOARD_REPR = (0x8a8a8a8a,
+                      0xa8a8a8a8,
+                      0x8a8a8a8a,
+                      0x88888888,
+                      0x88888888,
+                      0x28282828,
+                      0x82828282,
+                      0x28282828
+                      )
+
+# material value of pieces in tenths of a man (integers, so they can be summed up exactly), positive for white
+PIECE_VALUES = {0x2: 10, 0x3: 16, 0xa: -10, 0xb: -16}
+
+
+# representation -> class of the piece, 0x8 (empty cell) has none
+PIECE_CLASSES = {0x2: WhiteMan, 0x3: WhiteKing, 0xa: BlackMan, 0xb: BlackKing}
+# (row, column, shift of the cell in row of board_repr) of every playable square - light cells are never decoded
+SQUARE_CELL_SHIFTS = tuple((square // 4, 2 * (square % 4) + (square // 4 + 1) % 2,
+                            4 * (7 - 2 * (square % 4) - (square // 4 + 1) % 2)) for square in range(32))
+
+
+def _build_half_row_tables():
+    """
+    Half of a row of board_repr (16 bits, 4 cells) holds 2 playable cells - one byte of position_key
+    :return: ([row parity][byte of position_key] -> half row, [row parity] dict half row -> byte of position_key)
+    """
+    half_rows = ([], [])
+    half_row_keys = ({}, {})  # only of bytes made of representations of empty cell or piece
+    representations = (0x0,) + tuple(PIECE_CLASSES)
+    for parity in range(2):
+        for key_byte in range(256):
+            half_row = 0x8888
+            for index, representation in enumerate((key_byte & 0xF, key_byte >> 4)):
+                shift = 4 * (3 - 2 * index - (parity + 1) % 2)  # even rows start with a light cell
+                half_row = (half_row & ~(0xF << shift)) | ((representation or 0x8) << shift)
+            half_rows[parity].append(half_row)
+            if key_byte & 0xF in representations and key_byte >> 4 in representations:
+                half_row_keys[parity][half_row] = key_byte
+    return half_rows, half_row_keys
+
+
+HALF_ROWS, HALF_ROW_KEYS = _build_half_row_tables()
+
+
+def board_repr_from_position_key(position_key):
+    """
+    :param position_key: 4 bits per playable cell (square = row * 4 + column // 2), 0 for empty one
+    :return: Memory optimized representation of board (the one Board is created from)
+    """
+    return tuple((HALF_ROWS[row % 2][(position_key >> (16 * row)) & 0xFF] << 16)
+                 | HALF_ROWS[row % 2][(position_key >> (16 * row + 8)) & 0xFF] for row in range(8))
+
+
+def position_key_from_board_repr(board_repr):
+    """
+    :return: position_key of the board (see board_repr_from_position_key)
+    """
+    position_key = 0
+    for row, row_repr in enumerate(board_repr):
+        half_row_keys = HALF_ROW_KEYS[row % 2]
+        position_key |= (half_row_keys[row_repr >> 16] | (half_row_keys[row_repr & 0xFFFF] << 8)) << (16 * row)
+    return position_key
 
 
 class Board:
 
-    def __init__(self, board_repr=(0x8a8a8a8a,
-                                   0xa8a8a8a8,
-                                   0x8a8a8a8a,
-                                   0x88888888,
-                                   0x88888888,
-                                   0x28282828,
-                                   0x82828282,
-                                   0x28282828
-                                   ), next_turn=Color.WHITE, level=0):
+    def __init__(self, board_repr=INITIAL_BOARD_REPR, next_turn=Color.WHITE, level=0):
         """
         :type board_repr: Memory optimized representation of board
         """
         self.turn = next_turn
         self.level = level
+        self.last_move = None  # Move that led to this board (set by the parent's get_next_boards)
+        self.zobrist_hash = ZOBRIST_BLACK_TO_MOVE if next_turn == Color.BLACK else 0
+        self._piece_counts = [0] * 16  # indexed by piece representation
+        self._material = 0  # sum of PIECE_VALUES of all pieces
+        self._positional = 0  # sum of POSITIONAL_TABLE values of all pieces
+        self.position_key = 0  # nibbles of board_repr of the 32 playable cells packed into a single int
+        self._legal_moves = None  # cached by get_legal_moves, dropped whenever a piece is put or removed
         # 8 not allowed or empty
         # 2 white man
         # 3 white king
         # a black man
         # b black king
-        self.__board = [[], [], [], [], [], [], [], []]
-        for rowNumber, row in enumerate(board_repr):
-            mask = 0xF0000000
-            for columnNumber in range(8):
-                piece = row & mask
-                if piece == 0x80000000:  # empty or not allowed
-                    self.__board[rowNumber].append(None)
-                elif piece == 0x20000000:  # white man
-                    self.__board[rowNumber].append(WhiteMan(rowNumber, columnNumber, self))
-                elif piece == 0xa0000000:  # black man
-                    self.__board[rowNumber].append(BlackMan(rowNumber, columnNumber, self))
-                elif piece == 0x30000000:  # white king
-                    self.__board[rowNumber].append(WhiteKing(rowNumber, columnNumber, self))
-                elif piece == 0xb0000000:  # black king
-                    self.__board[rowNumber].append(BlackKing(rowNumber, columnNumber, self))
-                row = row << 4
+        self.__board = [[None] * 8 for _ in range(8)]
+        for square, (rowNumber, columnNumber, shift) in enumerate(SQUARE_CELL_SHIFTS):
+            representation = (board_repr[rowNumber] >> shift) & 0xF
+            if representation != 0x8:  # not empty
+                self.__board[rowNumber][columnNumber] = PIECE_CLASSES[representation](rowNumber, columnNumber, self)
+                self.zobrist_hash ^= zobrist_key(representation, rowNumber, columnNumber)
+                self._piece_counts[representation] += 1
+                self._material += PIECE_VALUES[representation]
+                self.position_key |= representation << (4 * square)
+                self._positional += POSITIONAL_TABLE[representation][square]
+
+    @classmethod
+    def from_position_key(cls, position_key, next_turn=Color.WHITE, level=0):
+        """
+        :param position_key: packed position - the position_key attribute of a board
+        """
+        return cls(board_repr_from_position_key(position_key), next_turn, level)
 
     @property
     def board_repr(self):
         """
         :return: Memory optimized representation of that board.
         """
-        board = [0, 0, 0, 0, 0, 0, 0, 0]
-        for rowNumber, row in enumerate(self.__board):
-            for columnNumber, piece in enumerate(row):
-                if piece is None:
-                    board[rowNumber] |= 0x00000008
-                else:
-                    board[rowNumber] |= piece.get_representation()
-                if columnNumber != 7:
-                    board[rowNumber] = board[rowNumber] << 4
-        return tuple(board)
+        return board_repr_from_position_key(self.position_key)
 
     @property
     def pieces(self):
@@ -92,19 +150,21 @@ class Board:
     @property
     def balance(self):
         """
-        :return: Positive balance means white is winning
-        """
-        result = 0.0
-        for piece in self.pieces:
-            if piece.get_representation() == 0x0000000a:  # isinstance(piece, BlackMan):
-                result -= 1.0
-            elif piece.get_representation() == 0x0000000b:  # isinstance(piece, BlackKing):
-                result -= 1.6
-            elif piece.get_representation() == 0x00000002:  # isinstance(piece, WhiteMan):
-                result += 1.0
-            elif piece.get_representation() == 0x00000003:  # isinstance(piece, WhiteKing):
-                result += 1.6
-        return result
+        :return: Positive balance means white is winning (material and positional terms of evaluation.py)
+        """
+        return (self._material * 10 + self._positional) / 100
+
+    def count_pieces(self, representation):
+        """
+        :param representation: 2 white man, 3 white king, a black man, b black king
+        :return: number of such pieces on the board
+        """
+        return self._piece_counts[representation]
+
+    def count_pieces_of_color(self, color):
+        if color == Color.WHITE:
+            return self._piece_counts[0x2] + self._piece_counts[0x3]
+        return self._piece_counts[0xa] + self._piece_counts[0xb]
 
     def is_there_piece_at(self, row, column):
         if self.__board[row][column] is None:
@@ -117,102 +177,151 @@ class Board:
         return self.__board[row][column]
 
     def delete_piece_at(self, row, column):
+        self._legal_moves = None
+        piece = self.__board[row][column]
+        if piece is not None:
+            representation = piece.get_representation()
+            self.zobrist_hash ^= zobrist_key(representation, row, column)
+            self._piece_counts[representation] -= 1
+            self._material -= PIECE_VALUES[representation]
+            self.position_key ^= representation << (4 * (row * 4 + column // 2))
+            self._positional -= POSITIONAL_TABLE[representation][row * 4 + column // 2]
         (self.__board[row][column]) = None
 
     def set_piece_at(self, row, column, piece):
+        self.delete_piece_at(row, column)
+        representation = piece.get_representation()
+        self.zobrist_hash ^= zobrist_key(representation, row, column)
+        self._piece_counts[representation] += 1
+        self._material += PIECE_VALUES[representation]
+        self.position_key ^= representation << (4 * (row * 4 + column // 2))
+        self._positional += POSITIONAL_TABLE[representation][row * 4 + column // 2]
         (self.__board[row][column]) = piece
 
     def get_next_boards(self):
         """
-        Generates all possible states generated from the current one (appends to self._next_states)
-        :return: -
+        Generates all possible states generated from the current one, a board is created only for the final
+        position of every move (attacks are followed on this board, see get_legal_moves)
+        :return: list of new boards (next level, next turn)
         """
-        set_of_new_boards = []
-
-        if self._does_any_piece_can_attack():
-            for piece in self.get_attacking_pieces_of_color(self.turn):
-
-                set_of_new_sub_boards = self._generate_next_boards_during_attack(piece)
-                for new_sub_board, after_attack_row, after_attack_col in set_of_new_sub_boards:
-
-                    # if attacking piece after finished attack is a man and can become a king - do so
-                    moved_piece = new_sub_board.get_piece_at(after_attack_row, after_attack_col)
-                    # if isinstance(piece, WhiteMan) or isinstance(piece, BlackMan)
-                    if moved_piece.get_representation() == 0x0000000a or moved_piece.get_representation() == 0x00000002:
-                        if moved_piece.can_be_replaced_with_king():
-                            moved_piece.replace_with_king()
+        return [self.get_board_after(move) for move in self.get_legal_moves()]
 
-                    set_of_new_boards.append(new_sub_board)
+    def iter_next_boards(self):
+        """
+        Lazy version of get_next_boards - every board is created only when it's requested
+        :return: generator of new boards (next level, next turn)
+        """
+        for move in self.get_legal_moves():
+            yield self.get_board_after(move)
 
-        else:
-            for piece in self.get_moving_pieces_of_color(self.turn):
+    def get_board_after(self, move):
+        """
+        :param move: Move generated by get_legal_moves
+        :return: new board (next level, next turn) with the move made, this one stays unchanged
+        """
+        board = self.copy()
+        board.make_move(move)
+        return board
 
+    def get_legal_moves(self):
+        """
+        Generates moves of the player whose turn it is, without copying the board (attacks are obligatory).
+        Attacks reaching the same position by jumping in different order are generated once.
+        Pieces are examined in a single pass and the result is kept until the board changes, so game end detection
+        and move generation of the same position share it (don't modify the returned list).
+        :return: list of Moves in the same order get_next_boards generates boards
+        """
+        if self._legal_moves is not None:
+            return self._legal_moves
+        attack_moves = []
+        moves = []
+        finished_attacks = set()
+        for piece in self.get_pieces_of_color(self.turn):
+            attacks = piece.possible_attacks
+            if attacks:
+                self._collect_attack_moves(piece, (piece.row, piece.column), [], [], attack_moves, finished_attacks,
+                                           attacks)
+            elif not attack_moves:  # moves are needed only if nobody can attack
+                is_man = piece.get_representation() == 0x0000000a or piece.get_representation() == 0x00000002
                 for after_move_row, after_move_col in piece.possible_moves:
-                    new_board_moved = self._get_board_after_movement(piece.row,
-                                                                     piece.column,
-                                                                     after_move_row,
-                                                                     after_move_col)
-
-                    # if moved_piece is a man and can become a king - do so
-                    moved_piece = new_board_moved.get_piece_at(after_move_row, after_move_col)
-                    # if isinstance(piece, WhiteMan) or isinstance(piece, BlackMan)
-                    if moved_piece.get_representation() == 0x0000000a or moved_piece.get_representation() == 0x00000002:
-                        if moved_piece.can_be_replaced_with_king():
-                            moved_piece.replace_with_king()
-
-                    set_of_new_boards.append(new_board_moved)
-
-        for board in set_of_new_boards:
-            board.next_level()
-            board.next_turn()
-        return set_of_new_boards
+                    promotion = is_man and after_move_row == (7 if piece.color == Color.BLACK else 0)
+                    moves.append(Move((piece.row, piece.column), (after_move_row, after_move_col), 0, promotion))
+        self._legal_moves = attack_moves or moves
+        return self._legal_moves
 
-    def _generate_next_boards_during_attack(self, piece):
+    def _collect_attack_moves(self, piece, start, path, captured, moves, finished_attacks, attacks):
         """
-        Generates all possible states generated from the current one for given piece
-        Used only during multiple-attack
-        :return: set of new states
+        Follows multiple-attacks of the piece on this board, reverting every attack after exploring it
+        :param path: cells the piece attacked to so far
+        :param captured: cells of pieces captured so far
+        :param finished_attacks: (start, end, captured cells) of attacks already appended to moves
+        :param attacks: possible_attacks of the piece
+        :return: - (appends finished attacks to moves)
         """
-        set_of_new_boards = []
-
-        for after_attack_row, after_attack_col in piece.possible_attacks:
-
-            new_board = \
-                self._get_board_after_attack(piece.row, piece.column, after_attack_row, after_attack_col)
-            set_of_new_boards.append(tuple((new_board, after_attack_row, after_attack_col)))
-
-            # if just appended state result in multiple-attack: append new states, delete prev.
-            attacking_piece: Piece = new_board.get_piece_at(after_attack_row, after_attack_col)
-            if attacking_piece.possible_attacks:
-
-                set_of_new_boards.pop()
-                set_of_new_sub_states = new_board._generate_next_boards_during_attack(attacking_piece)
-                for new_sub_state, after_sub_attack_row, after_sub_attack_col in set_of_new_sub_states:
-                    set_of_new_boards.append(tuple((new_sub_state, after_sub_attack_row, after_sub_attack_col)))
-
-        return set_of_new_boards
-
-    def _get_board_after_movement(self, row_current, column_current, row_desired, column_desired):
+        row_before, column_before = piece.row, piece.column
+        for after_attack_row, after_attack_col in attacks:
+            captured_piece = piece._attack_unsafely_to(after_attack_row, after_attack_col)
+            path.append((after_attack_row, after_attack_col))
+            captured.append((captured_piece.row, captured_piece.column))
+
+            next_attacks = piece.possible_attacks
+            if next_attacks:  # multiple-attack
+                self._collect_attack_moves(piece, start, path, captured, moves, finished_attacks, next_attacks)
+            elif (start, (after_attack_row, after_attack_col), frozenset(captured)) not in finished_attacks:
+                # the same position might be reached by jumping over the same pieces in different order
+                finished_attacks.add((start, (after_attack_row, after_attack_col), frozenset(captured)))
+                # if isinstance(piece, WhiteMan) or isinstance(piece, BlackMan)
+                promotion = (piece.get_representation() == 0x0000000a or piece.get_representation() == 0x00000002) \
+                    and piece.can_be_replaced_with_king()
+                moves.append(Move(start, (after_attack_row, after_attack_col), len(captured), promotion,
+                                  tuple(path), tuple(captured)))
+
+            captured.pop()
+            path.pop()
+            piece._move_unsafely_to(row_before, column_before)
+            self.set_piece_at(captured_piece.row, captured_piece.column, captured_piece)
+
+    def make_move(self, move):
         """
-        Universal method to move one piece from curr loc to desired. It's not validating movements!
-        :param row_current: current location of a piece to move
-        :param column_current: current location of a piece to move
-        :param row_desired: desired destination to move to
-        :param column_desired: desired destination to move to
-        :return: new state (deepcopy) generated due to the movement
+        Performs the move on this board (changes turn and level too)
+        :param move: Move generated by get_legal_moves
+        :return: record needed by unmake_move to revert the move
         """
-
-        # copy board and change it's copy
-        changed_board = Board(self.board_repr, self.turn, self.level)
-
-        if changed_board.is_there_piece_at(row_current, column_current):
-            moved_piece = changed_board.get_piece_at(row_current, column_current)
-            moved_piece.move_to(row_desired, column_desired)
-
-        else:
-            raise RuntimeError("Moving piece do not exist")
-
-        return changed_board
+        legal_moves = self._legal_moves
+        piece = self.__board[move.start[0]][move.start[1]]
+        captured_pieces = []
+        for row, column in move.captured:
+            captured_pieces.append(self.__board[row][column])
+            self.delete_piece_at(row, column)
+        piece._move_unsafely_to(move.end[0], move.end[1])
+        if move.promotion:
+            piece.replace_with_king()
+        record = (piece, captured_pieces, self.last_move, legal_moves)
+        self.last_move = move
+        self.next_level()
+        self.next_turn()
+        return record
+
+    def unmake_move(self, move, record):
+        """
+        Reverts the move done by make_move
+        :param record: value returned by make_move
+        :return: -
+        """
+        piece, captured_pieces, self.last_move, legal_moves = record
+        self.level -= 1
+        self.next_turn()
+        if move.promotion:
+            self.set_piece_at(move.end[0], move.end[1], piece)  # put the man back in place of its king
+        piece._move_unsafely_to(move.start[0], move.start[1])
+        for (row, column), captured_piece in zip(move.captured, captured_pieces):
+            self.set_piece_at(row, column, captured_piece)
+        self._legal_moves = legal_moves  # the position is the same as before make_move
+
+    def copy(self):
+        board = Board(self.board_repr, self.turn, self.level)
+        board.last_move = self.last_move
+        return board
 
     def _get_board_after_attack(self, row_current, column_current, row_after_attack, column_after_attack):
         """
@@ -236,30 +345,19 @@ class Board:
 
         return changed_board
 
-    def _does_any_piece_can_attack(self):
-        """
-        Defines if any piece can attack
-        :return: true/false
-        """
-        for piece in self.get_pieces_of_color(self.turn):
-            if piece.can_attack_anywhere():
-                return True
-        return False
-
     def did_game_end(self):
         """
         Defines if state is terminal or not
         :return: true/false
         """
-        # get pieces of player that is moving in this turn
-        pieces = self.get_pieces_of_color(self.turn)
-
-        if not pieces:  # if you have no pieces left its game over
+        if not self.count_pieces_of_color(self.turn):  # if you have no pieces left its game over
             return True
+        if self._legal_moves is not None:
+            return not self._legal_moves
 
         # check if there's any move or attack current player can perform
         found_move_or_attack = False
-        for piece in pieces:
+        for piece in self.get_pieces_of_color(self.turn):
             if piece.possible_attacks or piece.possible_moves:
                 found_move_or_attack = True
                 break
@@ -284,6 +382,8 @@ class Board:
             self.turn = Color.WHITE
         else:
             self.turn = Color.BLACK
+        self.zobrist_hash ^= ZOBRIST_BLACK_TO_MOVE
+        self._legal_moves = None
 
     def __str__(self):
         result = "   "
@@ -302,3 +402,6 @@ class Board:
             result += "|" + "\n"
             row_count += 1
         return result
+
+
+BOARD_CLASSES.append(Board)  # set_weights is refused while instances exist
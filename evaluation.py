@@ -0,0 +1,116 @@
+import gc
+import json
+
+# Positional part of the evaluation: every term depends only on a single piece and its square, so all of them are
+# summed into one table (piece representation x square) and boards update their score with one lookup whenever
+# a piece is put or removed - the cost per node doesn't depend on the number of terms.
+# Values are in hundredths of a man, from white's point of view (black pieces have them negated).
+# Squares are numbered like in bitboard.py: square = row * 4 + column // 2. White men move toward row 0.
+
+DEFAULT_WEIGHTS = {
+    "tempo": 2,  # man, per row advanced toward promotion
+    "center": 4,  # man on one of the 8 central squares
+    "king_center": 6,  # king on one of the 8 central squares
+    "back_rank": 8,  # man guarding its own back rank (opponent can't promote there)
+    "edge": -3,  # piece on the side column (can't be captured, but controls only one diagonal)
+    "piece_square_tables": {},  # "man" / "king": 32 values added for white pieces (mirrored for black ones)
+}
+
+# POSITIONAL_TABLE[piece representation][square], changed in place by set_weights
+POSITIONAL_TABLE = [[0] * 32 for _ in range(16)]
+weights_version = 0  # incremented whenever weights change (lets users cache tables derived from them)
+BOARD_CLASSES = []  # classes keeping incremental sums of POSITIONAL_TABLE values, registered by their modules
+
+
+def _square_cell(square):
+    row = square // 4
+    return row, 2 * (square % 4) + (1 if row % 2 == 0 else 0)
+
+
+def _white_piece_value(weights, is_king, square):
+    """
+    :return: value of white piece standing on the square
+    """
+    row, column = _square_cell(square)
+    value = 0
+    is_center = 3 <= row <= 4 and 2 <= column <= 5
+    if is_king:
+        value += weights["king_center"] * is_center
+    else:
+        value += weights["tempo"] * (7 - row)
+        value += weights["center"] * is_center
+        value += weights["back_rank"] * (row == 7)
+    value += weights["edge"] * (column in (0, 7))
+    table = weights["piece_square_tables"].get("king" if is_king else "man")
+    if table:
+        value += table[square]
+    return value
+
+
+def build_positional_table(weights):
+    """
+    :param weights: dict like DEFAULT_WEIGHTS
+    :return: table[piece representation][square]
+    """
+    table = [[0] * 32 for _ in range(16)]
+    for square in range(32):
+        table[0x2][square] = _white_piece_value(weights, False, square)
+        table[0x3][square] = _white_piece_value(weights, True, square)
+        # black piece on the square is in the same situation as white one on the mirrored square
+        table[0xa][square] = -_white_piece_value(weights, False, 31 - square)
+        table[0xb][square] = -_white_piece_value(weights, True, 31 - square)
+    return table
+
+
+def validate_weights(weights):
+    """
+    :raise ValueError: if weights aren't like DEFAULT_WEIGHTS (unknown key, not integer value or table of wrong size)
+    :return: -
+    """
+    for name, value in weights.items():
+        if name not in DEFAULT_WEIGHTS:
+            raise ValueError(f"unknown evaluation weight {name!r}")
+        if name != "piece_square_tables" and not isinstance(value, int):
+            raise ValueError(f"evaluation weight {name!r} has to be an integer (hundredths of a man), not {value!r}")
+    for piece, table in weights.get("piece_square_tables", {}).items():
+        if piece not in ("man", "king"):
+            raise ValueError(f"piece square table of unknown piece {piece!r}")
+        if not isinstance(table, list) or len(table) != 32 or not all(isinstance(value, int) for value in table):
+            raise ValueError(f"piece square table of {piece} has to be a list of 32 integers")
+
+
+def load_weights(path):
+    """
+    :param path: JSON file with any of DEFAULT_WEIGHTS keys (missing ones keep default values)
+    :raise ValueError: if the file doesn't describe valid weights
+    :return: weights
+    """
+    with open(path) as weights_file:
+        weights = json.load(weights_file)
+    if not isinstance(weights, dict):
+        raise ValueError(f"{path} doesn't contain an object of evaluation weights")
+    validate_weights(weights)
+    return dict(DEFAULT_WEIGHTS, **weights)
+
+
+def set_weights(weights):
+    """
+    Changes evaluation of boards created from now on. Refused while a board evaluated with other weights exists -
+    its incrementally updated score would mix both tables (and every search in the process shares the weights).
+    :raise ValueError: if weights are invalid or a board exists
+    :return: -
+    """
+    global weights_version
+    validate_weights(weights)
+    table = build_positional_table(weights)
+    if table == POSITIONAL_TABLE:
+        return
+    gc.collect()  # pieces refer to their board - unreachable boards are freed only by the collector
+    board_classes = tuple(BOARD_CLASSES)
+    if board_classes and any(isinstance(item, board_classes) for item in gc.get_objects()):
+        raise ValueError("evaluation weights can't change while boards evaluated with the current ones exist")
+    POSITIONAL_TABLE[:] = table
+    weights_version += 1
+
+
+set_weights(DEFAULT_WEIGHTS)
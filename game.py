@@ -1,29 +1,143 @@
 from state import *
 from search_algorithm import SearchAlgorithm
+from bitboard import BitBoard
+from transposition_table import TranspositionTable
+from parallel_search import ParallelSearch
+from tablebase import Tablebase
+from opening_book import OpeningBook
+from search_statistics import SearchStatistics
+from evaluation import DEFAULT_WEIGHTS, load_weights, set_weights
 import time
-import copy
+
+# the game is drawn when the same position (side to move included) occurs for the DRAW_REPETITIONS-th time,
+# or after DRAW_PLIES_WITHOUT_PROGRESS plies in a row without a capture or a move of a man (only kings moving)
+DRAW_REPETITIONS = 3
+DRAW_PLIES_WITHOUT_PROGRESS = 50
+
 
 class Game:
-    def __init__(self, depth):
+    def __init__(self, depth, board_class=Board, transposition_table_size_in_mb=None, time_limit=None,
+                 node_limit=None, workers=None, split_depth=1, make_unmake=False, tablebase_path=None,
+                 opening_book_path=None, evaluation_weights_path=None, quiescence=False,
+                 principal_variation_search=False, aspiration_window=None, mtdf=False, measure_speedup=False):
+        """
+        :param depth: search depth (maximal one if time_limit or node_limit is given)
+        :param board_class: Board or BitBoard - engine used to generate positions
+        :param transposition_table_size_in_mb: memory cap of transposition table, None to search without it
+        :param time_limit: seconds per move - search deepens iteratively until it runs out of time
+        :param node_limit: visited nodes per move - search deepens iteratively until it runs out of nodes
+        :param workers: number of processes searching in parallel, None for single-process search
+        :param split_depth: used with workers - 1 to distribute children of the root, 2 to distribute grandchildren
+        :param make_unmake: search by making and reverting moves on one board instead of copying boards
+        :param tablebase_path: endgame tablebase file (see tablebase.py), None to search without it
+        :param opening_book_path: opening book file (see opening_book.py), None to search from the first move
+        :param evaluation_weights_path: JSON file of evaluation weights (see evaluation.py), None for default ones.
+                                        Weights are shared by the whole process - ValueError is raised while
+                                        another game (or any board) evaluated with different weights exists
+        :param quiescence: leaves in the middle of capture sequences are searched until they're quiet
+        :param principal_variation_search: search with null windows all but the first child
+        :param aspiration_window: half-width of the window around the value of the previous iteration of
+                                  iterative deepening, None for the full window (single-process search only)
+        :param mtdf: search by MTD(f) - sequence of null window searches, requires transposition_table_size_in_mb
+                     (single-process search only)
+        :param measure_speedup: used with workers - every move is searched by single-process search too and
+                                the speedup of the parallel search is reported (doubles the time of every move)
+        """
+        if workers is not None and (aspiration_window is not None or mtdf):
+            raise ValueError("aspiration window and MTD(f) aren't supported by the parallel search")
+        # before the first board is evaluated, also back to default ones after a game with other weights
+        set_weights(load_weights(evaluation_weights_path) if evaluation_weights_path is not None else DEFAULT_WEIGHTS)
         self.moves_made = 0
-        self.current_state = State(Board())
+        self.current_state = State(board_class())
+        self.position_counts = {(self.current_state.key, self.current_state.turn): 1}
+        self.plies_without_progress = 0
         self.depth = depth
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.opening_book = OpeningBook(opening_book_path) if opening_book_path is not None else None
+        if workers is not None:
+            self.search_algorithm = ParallelSearch(workers, split_depth, transposition_table_size_in_mb,
+                                                   make_unmake=make_unmake, tablebase_path=tablebase_path,
+                                                   evaluation_weights_path=evaluation_weights_path,
+                                                   measure_speedup=measure_speedup, quiescence=quiescence,
+                                                   principal_variation_search=principal_variation_search)
+        else:
+            table = TranspositionTable(transposition_table_size_in_mb) \
+                if transposition_table_size_in_mb is not None else None
+            tablebase = Tablebase(tablebase_path) if tablebase_path is not None else None
+            self.search_algorithm = SearchAlgorithm(table, make_unmake=make_unmake, tablebase=tablebase,
+                                                    quiescence=quiescence,
+                                                    principal_variation_search=principal_variation_search,
+                                                    aspiration_window=aspiration_window, mtdf=mtdf)
 
     def calculate_next_move(self):
+        """
+        Searches for the best move from the current state (it becomes current_state.next_move)
+        :return: SearchStatistics of the search
+        """
         if self.is_finished():
             raise RuntimeError("Making moves in a finished game")
         print(f"Calculating move number {self.moves_made + 1}")
-        SearchAlgorithm().alpha_beta(self.current_state, self.depth)
+        if self.opening_book is not None:
+            board = self.current_state._board
+            book_move = self.opening_book.find_move(board)
+            if book_move is not None:
+                move, value = book_move
+                self.current_state.next_move = State(board.get_board_after(move))
+                statistics = SearchStatistics()
+                statistics.finish(value, 0, [move])
+                print(f"Opening book move: {move} value={value}")
+                return statistics
+        if self.time_limit is None and self.node_limit is None:
+            self.search_algorithm.alpha_beta(self.current_state, self.depth)
+        else:
+            self.search_algorithm.iterative_deepening(self.current_state, self.depth, self.time_limit,
+                                                      self.node_limit)
+        if isinstance(self.search_algorithm, ParallelSearch):
+            speedup = f"speedup: {self.search_algorithm.last_speedup:.2f} " \
+                if self.search_algorithm.last_speedup is not None else ""
+            print(f"Parallel {speedup}utilization: {self.search_algorithm.last_utilization:.2f} "
+                  f"({self.search_algorithm.workers} workers)")
+        print(self.search_algorithm.statistics)
+        return self.search_algorithm.statistics
+
+    def close(self):
+        """
+        Stops processes of the parallel search and closes files of the tablebase and the opening book
+        :return: -
+        """
+        if isinstance(self.search_algorithm, ParallelSearch):
+            self.search_algorithm.close()
+        elif self.search_algorithm.tablebase is not None:
+            self.search_algorithm.tablebase.close()
+        if self.opening_book is not None:
+            self.opening_book.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def make_move(self):
         if self.is_finished():
             raise RuntimeError("Making moves in a finished game")
 
+        # the chosen child becomes the root - its subtree (cached successors) is reused by the next search
         next_state = self.current_state.next_move
-        self.current_state = copy.deepcopy(next_state)
+        move = next_state.move
+        row, column = move.start
+        moved_representation = (self.current_state.key >> (4 * (row * 4 + column // 2))) & 0xF
+        if move.captured_count or moved_representation in (0x2, 0xa):  # men can't move back - no repetition
+            self.plies_without_progress = 0
+        else:
+            self.plies_without_progress += 1
+        position = (next_state.key, next_state.turn)
+        self.position_counts[position] = self.position_counts.get(position, 0) + 1
+        self.search_algorithm.advance(move)
+        self.current_state = next_state
         self.current_state.reset_level()
-        self.current_state.next_move = None
-        self.current_state._value = None
+        self.current_state.next_move = None  # its principal variation is kept by the search algorithm
         self.moves_made += 1
 
     @property
@@ -38,7 +152,14 @@ class Game:
     def is_finished(self):
         if self.current_state.is_terminal:
             return True
-        return False
+        return self.is_draw()
+
+    def is_draw(self):
+        """
+        :return: true if the game ended in a draw by repetition or by moving only kings for too long
+        """
+        return self.position_counts[(self.current_state.key, self.current_state.turn)] >= DRAW_REPETITIONS \
+            or self.plies_without_progress >= DRAW_PLIES_WITHOUT_PROGRESS
 
 
 def run_game():
@@ -54,15 +175,15 @@ def run_game():
             break
 
     # play game till the end and save it history
-    game = Game(depth)
     game_history = []
 
     start_time = time.time()
-    while game.is_finished() is False:
-        game.calculate_next_move()
-        game_history.append((game.current_state, game.decision_chain))
-        game.make_move()
-    game_history.append((game.current_state, game.decision_chain))  # append the last move
+    with Game(depth) as game:
+        while game.is_finished() is False:
+            game.calculate_next_move()
+            game_history.append((game.current_state, game.decision_chain))
+            game.make_move()
+        game_history.append((game.current_state, game.decision_chain))  # append the last move
     end_time = time.time()
 
     print("calculation time [s]: " + f'{end_time - start_time}')
@@ -80,11 +201,11 @@ def run_game():
 
 
 def test_evaluation_time():
-    game = Game(8)
     start_time = time.time()
-    while game.is_finished() is False:
-        game.calculate_next_move()
-        game.make_move()
+    with Game(8) as game:
+        while game.is_finished() is False:
+            game.calculate_next_move()
+            game.make_move()
     end_time = time.time()
     print("calculation time [s]: " + f'{end_time - start_time}')
 
@@ -0,0 +1,54 @@
+class Move:
+    """
+    Describes how a board was reached from its parent board
+    """
+
+    def __init__(self, start, end, captured_count=0, promotion=False, path=(), captured=(), captured_mask=None):
+        """
+        :param start: (row, column) of the moving piece before the move
+        :param end: (row, column) of the moving piece after the move (after the last attack)
+        :param captured_count: number of pieces captured by the move
+        :param promotion: true if the moving man became a king
+        :param path: (row, column) after every single attack, ending with end - only if known
+        :param captured: (row, column) of every captured piece in order of capturing - only if known
+        :param captured_mask: squares (square = row * 4 + column // 2) of captured pieces as bits,
+                              None to compute it from captured
+        """
+        self.start = start
+        self.end = end
+        self.captured_count = captured_count
+        self.promotion = promotion
+        self.path = path
+        self.captured = captured
+        if captured_mask is None:
+            captured_mask = sum(1 << (row * 4 + column // 2) for row, column in captured) if captured else 0
+        self.captured_mask = captured_mask
+
+    @property
+    def cells_key(self):
+        """
+        :return: Small int (< 4096) identifying cells of the move (the same for captures of the same piece between
+                 the same cells over different pieces)
+        """
+        return (self.start[0] * 8 + self.start[1]) * 64 + self.end[0] * 8 + self.end[1]
+
+    @property
+    def key(self):
+        """
+        :return: Int identifying the move among legal moves of a board: cells_key and captured_mask above it
+                 (so it's the same as cells_key, smaller than 4096, for moves without captures)
+        """
+        return (self.start[0] * 8 + self.start[1]) * 64 + self.end[0] * 8 + self.end[1] | self.captured_mask << 12
+
+    def __eq__(self, other):
+        return isinstance(other, Move) and self.start == other.start and self.end == other.end \
+            and self.captured_mask == other.captured_mask
+
+    def __hash__(self):
+        return self.key
+
+    def __str__(self):
+        return f"{self.start}->{self.end}"
+
+    def __repr__(self):
+        return f"Move({self.start}, {self.end}, {self.captured_count}, {self.promotion})"
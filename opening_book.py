@@ -0,0 +1,124 @@
+import mmap
+import struct
+import sys
+import time
+
+from bitboard import BitBoard
+from search_algorithm import *
+
+# Opening book: the best move of positions met in the first plies of a game, found by deep searches.
+# File: header, then records sorted by Zobrist hash of the position (side to move included).
+# Record: hash (8 bytes), Move.cells_key of the best move (2 bytes), squares of pieces it captures (4 bytes - captures
+# between the same cells may jump over different pieces), value of the position in hundredths of a man (4 bytes).
+
+OPENING_BOOK_MAGIC = b"CKOB"
+OPENING_BOOK_HEADER = struct.Struct("<4sBI")  # magic, version, number of records
+OPENING_BOOK_RECORD = struct.Struct("<QHIi")
+OPENING_BOOK_VERSION = 3
+
+
+def captured_squares(move):
+    """
+    :param move: Move of a board
+    :return: mask of squares (square = row * 4 + column // 2) of pieces captured by the move
+    """
+    return move.captured_mask
+
+
+def generate_opening_book(path, plies=3, depth=8, board_class=BitBoard, transposition_table_size_in_mb=16,
+                          verbose=True):
+    """
+    Searches every position reachable from the initial one in less than plies moves (all moves of both sides)
+    :param depth: depth of the search of every position
+    :return: number of stored positions
+    """
+    start_time = time.time()
+    search_algorithm = SearchAlgorithm(TranspositionTable(transposition_table_size_in_mb))
+    records = {}
+    positions = [board_class()]
+    for ply in range(plies):
+        next_positions = []
+        for board in positions:
+            if board.zobrist_hash in records or board.did_game_end():
+                continue
+            state = State(board)
+            value = search_algorithm.iterative_deepening(state, depth)
+            best_move = next(move for move in board.get_legal_moves()
+                             if board.get_board_after(move).position_key == state.next_move.key)
+            records[board.zobrist_hash] = (best_move.cells_key, captured_squares(best_move), round(value * 100))
+            if ply + 1 < plies:
+                next_positions.extend(board.get_next_boards())
+        positions = next_positions
+        if verbose:
+            print(f"ply {ply + 1}: {len(records)} positions searched in [s]: {time.time() - start_time:.1f}")
+
+    with open(path, "wb") as book_file:
+        book_file.write(OPENING_BOOK_HEADER.pack(OPENING_BOOK_MAGIC, OPENING_BOOK_VERSION, len(records)))
+        for zobrist_hash in sorted(records):
+            book_file.write(OPENING_BOOK_RECORD.pack(zobrist_hash, *records[zobrist_hash]))
+    return len(records)
+
+
+class OpeningBook:
+    """
+    Memory-mapped opening book file made by generate_opening_book, positions are found by binary search
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.size = OPENING_BOOK_HEADER.unpack_from(self._data)
+        if magic != OPENING_BOOK_MAGIC or version != OPENING_BOOK_VERSION:
+            raise ValueError(f"{path} is not an opening book file of version {OPENING_BOOK_VERSION}")
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        self._data.close()
+        self._file.close()
+
+    def _record(self, index):
+        return OPENING_BOOK_RECORD.unpack_from(self._data, OPENING_BOOK_HEADER.size + index * OPENING_BOOK_RECORD.size)
+
+    def probe(self, zobrist_hash):
+        """
+        :return: (Move.cells_key of the best move, captured_squares of it, value of the position)
+                 or None if the position isn't in the book
+        """
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self._record(middle)[0] < zobrist_hash:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.size:
+            stored_hash, move_key, captured, value = self._record(low)
+            if stored_hash == zobrist_hash:
+                self.hits += 1
+                return move_key, captured, value / 100
+        self.misses += 1
+        return None
+
+    def find_move(self, board):
+        """
+        :return: (legal Move of the board stored in the book, value of the position) or None
+        """
+        probed = self.probe(board.zobrist_hash)
+        if probed is None:
+            return None
+        move_key, captured, value = probed
+        for move in board.get_legal_moves():
+            if move.cells_key == move_key and captured_squares(move) == captured:
+                return move, value
+        return None  # other position with the same hash
+
+    def __str__(self):
+        return f"OpeningBook positions={self.size} hits={self.hits} misses={self.misses}"
+
+
+if __name__ == '__main__':
+    generate_opening_book(sys.argv[1] if len(sys.argv) > 1 else "opening_book.bin",
+                          int(sys.argv[2]) if len(sys.argv) > 2 else 3,
+                          int(sys.argv[3]) if len(sys.argv) > 3 else 8)
@@ -0,0 +1,288 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from search_algorithm import *
+from tablebase import Tablebase
+from evaluation import load_weights, set_weights
+
+TIE_MARGIN = 1e-6  # subtrees are searched with the window just below the best value, so equal values are exact
+
+_shared_bound = None  # in worker process: best root value found so far (white's point of view)
+_shared_stop = None  # in worker process: set when the search is stopped (its budget is exhausted)
+_worker_search = None  # in worker process: search reused between subtrees (keeps its transposition table)
+
+
+class _BoundSharingSearch(SearchAlgorithm):
+    """
+    Searches a subtree of the root, narrowing the window at every node with the best root value found so far
+    """
+
+    def __init__(self, transposition_table=None, move_ordering=True, make_unmake=False, tablebase=None,
+                 batch_evaluation=False, quiescence=False, principal_variation_search=False):
+        super().__init__(transposition_table, move_ordering, make_unmake, tablebase, batch_evaluation, quiescence,
+                         principal_variation_search=principal_variation_search)
+        self.root_turn = Color.WHITE
+
+    def _alpha_beta(self, root_state, depth, alpha, beta, ply=0):
+        if _shared_stop.value:
+            raise SearchTimeout()
+        if self.root_turn == Color.WHITE:
+            alpha = max(alpha, _shared_bound.value - TIE_MARGIN)
+        else:
+            beta = min(beta, _shared_bound.value + TIE_MARGIN)
+        return super()._alpha_beta(root_state, depth, alpha, beta, ply)
+
+
+def _init_worker(shared_bound, shared_stop, transposition_table_size_in_mb, move_ordering, make_unmake,
+                 tablebase_path, evaluation_weights_path, search_options):
+    global _shared_bound, _shared_stop, _worker_search
+    if evaluation_weights_path:
+        set_weights(load_weights(evaluation_weights_path))
+    _shared_bound = shared_bound
+    _shared_stop = shared_stop
+    table = TranspositionTable(transposition_table_size_in_mb) if transposition_table_size_in_mb else None
+    tablebase = Tablebase(tablebase_path) if tablebase_path else None  # every process maps the file itself
+    _worker_search = _BoundSharingSearch(table, move_ordering, make_unmake, tablebase, **search_options)
+
+
+def _search_subtree(board_class, position_key, turn, level, depth, root_turn, deadline=None, node_limit=None):
+    """
+    Runs in worker process
+    :param deadline: time.time() the search has to stop at, None for no limit
+    :param node_limit: number of nodes the search of the subtree may visit, None for no limit
+    :return: (value or None if the search was stopped, SearchStatistics, Move.key of principal variation,
+              CPU time spent [s])
+    """
+    start_time = time.process_time()
+    state = State(board_class.from_position_key(position_key, turn, level))
+    _worker_search.root_turn = root_turn
+    _worker_search._start_search()
+    _worker_search._deadline = deadline
+    _worker_search._node_limit = node_limit
+    try:
+        value = _worker_search._alpha_beta(state, depth, -999999, 999999)
+    except SearchTimeout:
+        return None, _worker_search.statistics, [], time.process_time() - start_time
+    return value, _worker_search.statistics, _worker_search._get_principal_variation(state), \
+        time.process_time() - start_time
+
+
+class ParallelSearch(SearchAlgorithm):
+    """
+    Root-parallel alpha-beta: subtrees of the root (or of its children) are searched by a pool of processes.
+    Workers share the best root value found so far, so later subtrees are searched with a narrower window.
+    Chooses the same move as SearchAlgorithm.alpha_beta with the same options at the same depth.
+    Iterative deepening strategies (aspiration windows, MTD(f)) aren't supported - subtrees are searched
+    with windows given by the shared bound.
+    """
+
+    def __init__(self, workers=None, split_depth=1, transposition_table_size_in_mb=None, move_ordering=True,
+                 make_unmake=False, tablebase_path=None, evaluation_weights_path=None, measure_speedup=False,
+                 batch_evaluation=False, quiescence=False, principal_variation_search=False):
+        """
+        :param workers: number of processes, None for number of cores
+        :param split_depth: 1 - every child of the root is a task, 2 - every grandchild is a task
+        :param transposition_table_size_in_mb: memory cap of transposition table of every worker
+        :param make_unmake: workers search by making and reverting moves instead of copying boards
+        :param tablebase_path: file made by tablebase.generate_tablebase probed by workers, None to search without it
+        :param evaluation_weights_path: JSON file of evaluation weights loaded by workers, None for default ones
+        :param measure_speedup: every search is repeated by a single-process search in this process (with the same
+                                settings) and the ratio of their times is reported - doubles the time of every move
+        :param batch_evaluation: workers evaluate leaves in batches (see SearchAlgorithm)
+        :param quiescence: workers search leaves in the middle of capture sequences until they're quiet
+        :param principal_variation_search: workers search subtrees by principal variation search
+        """
+        search_options = {"batch_evaluation": batch_evaluation, "quiescence": quiescence,
+                          "principal_variation_search": principal_variation_search}
+        super().__init__(None, move_ordering, **search_options)
+        self.workers = workers or os.cpu_count()
+        self.split_depth = split_depth
+        self.last_utilization = None  # CPU time of all workers in relation to wall time of the last search
+        self.last_speedup = None  # time of the single-process search in relation to the last search
+        self.speedups = []
+        self._serial_search = None
+        if measure_speedup:
+            table = TranspositionTable(transposition_table_size_in_mb) if transposition_table_size_in_mb else None
+            tablebase = Tablebase(tablebase_path) if tablebase_path else None
+            self._serial_search = SearchAlgorithm(table, move_ordering, make_unmake, tablebase, **search_options)
+        self._shared_bound = multiprocessing.Value("d", 0.0, lock=False)
+        self._shared_stop = multiprocessing.Value("b", 0, lock=False)
+        self._executor = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                             initargs=(self._shared_bound, self._shared_stop,
+                                                       transposition_table_size_in_mb, move_ordering, make_unmake,
+                                                       tablebase_path, evaluation_weights_path, search_options))
+
+    def close(self):
+        self._executor.shutdown()
+        if self._serial_search is not None and self._serial_search.tablebase is not None:
+            self._serial_search.tablebase.close()
+
+    def alpha_beta(self, root_state, depth):
+        return self._parallel_alpha_beta(root_state, depth)
+
+    def _parallel_alpha_beta(self, root_state, depth, deadline=None, node_limit=None):
+        """
+        :param deadline: time.time() the search has to stop at, None for no limit
+        :param node_limit: number of nodes the search may visit, None for no limit
+        :return: value of the root, SearchTimeout is raised if the search didn't finish within the budget
+                 (root_state.next_move is left as it was)
+        """
+        self._start_search()
+        start_time = time.time()
+        statistics = self.statistics
+        statistics.count_node(0)
+        if depth <= 0 or root_state.is_terminal:
+            statistics.leaf_evaluations += 1
+            statistics.finish(root_state.balance, depth, [])
+            return root_state.balance
+
+        is_white = root_state.turn == Color.WHITE
+        self._shared_bound.value = -999999 if is_white else 999999
+        children = self._ordered(list(root_state.next_states), root_state.turn, 0, None)
+
+        # task: (child index, grandchild index or None, state to search, depth)
+        tasks = []
+        grandchildren = {}
+        values = [None] * len(children)
+        for index, child_state in enumerate(children):
+            statistics.count_node(1)
+            if child_state.is_terminal or (depth == 1 and not self.quiescence):  # quiescence leaves go to workers
+                values[index] = child_state.balance
+                statistics.leaf_evaluations += 1
+            elif self.split_depth >= 2 and depth >= 2:
+                grandchildren[index] = self._ordered(list(child_state.next_states), child_state.turn, 1, None)
+                for sub_index, grandchild_state in enumerate(grandchildren[index]):
+                    tasks.append((index, sub_index, grandchild_state, depth - 2))
+            else:
+                tasks.append((index, None, child_state, depth - 1))
+
+        self._shared_stop.value = 0
+        futures = {}
+        for task in tasks:
+            index, sub_index, state, task_depth = task
+            future = self._executor.submit(_search_subtree, state._board_class, state.key, state.turn, state.level,
+                                           task_depth, root_state.turn, deadline, node_limit)
+            futures[future] = task
+
+        sub_values = {index: [None] * len(states) for index, states in grandchildren.items()}
+        principal_variations = {}
+        busy_time = 0.0
+        for index, value in enumerate(values):
+            if value is not None:
+                self._share(value, is_white)
+        stopped = False
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            index, sub_index, _, _ = futures[future]
+            value, subtree_statistics, principal_variation, elapsed = future.result()
+            self.nodes += subtree_statistics.nodes
+            statistics.merge(subtree_statistics, 1 if sub_index is None else 2)
+            busy_time += elapsed
+            if not stopped and (value is None or (node_limit is not None and statistics.nodes > node_limit)):
+                # the rest of the workers stop at their next node, tasks not started yet are dropped
+                stopped = True
+                self._shared_stop.value = 1
+                for pending in futures:
+                    pending.cancel()
+            if stopped:
+                continue
+            principal_variations[(index, sub_index)] = principal_variation
+            if sub_index is None:
+                values[index] = value
+            else:
+                sub_values[index][sub_index] = value
+                if None in sub_values[index]:
+                    continue
+                values[index] = max(sub_values[index]) if not is_white else min(sub_values[index])
+            self._share(values[index], is_white)
+        if stopped:
+            self.nodes = statistics.nodes
+            raise SearchTimeout()
+
+        # pick the move exactly like the serial search does - the first one with the best value
+        result = -999999 if is_white else 999999
+        for index, value in enumerate(values):
+            if (is_white and value > result) or (not is_white and value < result):
+                result = value
+                root_state.next_move = children[index]
+        chosen_index = children.index(root_state.next_move)
+        chosen_state = root_state.next_move
+        if chosen_index in grandchildren:
+            best_sub_value = None
+            for sub_index, sub_value in enumerate(sub_values[chosen_index]):
+                if best_sub_value is None or (sub_value < best_sub_value if is_white else sub_value > best_sub_value):
+                    best_sub_value = sub_value
+                    chosen_state.next_move = grandchildren[chosen_index][sub_index]
+            sub_index = grandchildren[chosen_index].index(chosen_state.next_move)
+            self._follow(chosen_state.next_move, principal_variations[(chosen_index, sub_index)])
+        elif (chosen_index, None) in principal_variations:
+            self._follow(chosen_state, principal_variations[(chosen_index, None)])
+
+        elapsed_time = time.time() - start_time
+        self.last_utilization = busy_time / elapsed_time if elapsed_time > 0 else 1.0
+        if self._serial_search is not None:
+            serial_state = State(root_state._board_class.from_position_key(root_state.key, root_state.turn,
+                                                                         root_state.level))
+            serial_start_time = time.time()
+            self._serial_search.alpha_beta(serial_state, depth)
+            serial_time = time.time() - serial_start_time
+            self.last_speedup = serial_time / elapsed_time if elapsed_time > 0 else 1.0
+            self.speedups.append(self.last_speedup)
+        self.completed_depth = depth
+        self._principal_variation = self._get_principal_variation(root_state)
+        self.nodes = statistics.nodes
+        statistics.finish(result, depth, self._get_decision_chain_moves(root_state))
+        return result
+
+    def iterative_deepening(self, root_state, max_depth, time_limit=None, node_limit=None):
+        """
+        Searches with depth 1, 2, 3... until max_depth is reached or the budget is exhausted - workers stop
+        in the middle of the iteration once it is. Depth 1 is always completed.
+        :return: value of the last completed iteration
+        """
+        start_time = time.time()
+        result = root_state.balance
+        statistics = SearchStatistics()
+        self.completed_depth = 0
+        for depth in range(1, max_depth + 1):
+            deadline = start_time + time_limit if time_limit is not None and depth > 1 else None
+            nodes_left = node_limit - statistics.nodes if node_limit is not None and depth > 1 else None
+            if nodes_left is not None and nodes_left <= 0:
+                break
+            try:
+                result = self._parallel_alpha_beta(root_state, depth, deadline, nodes_left)
+            except SearchTimeout:
+                statistics.merge(self.statistics)
+                break
+            statistics.merge(self.statistics)
+            statistics.nodes_per_iteration.append(self.statistics.nodes)
+        statistics.finish(result, self.completed_depth, self._get_decision_chain_moves(root_state))
+        self.statistics = statistics
+        self.nodes = statistics.nodes
+        return result
+
+    def _share(self, value, is_white):
+        """
+        Lets workers narrow their windows with the best root value found so far
+        :return: -
+        """
+        if (is_white and value > self._shared_bound.value) or (not is_white and value < self._shared_bound.value):
+            self._shared_bound.value = value
+
+    @staticmethod
+    def _follow(state, principal_variation):
+        """
+        Rebuilds decision chain found by worker (child states are regenerated in this process)
+        :return: -
+        """
+        for move_key in principal_variation:
+            for child_state in state.next_states:
+                if child_state.move.key == move_key:
+                    state.next_move = child_state
+                    state = child_state
+                    break
+            else:
+                return
@@ -0,0 +1,131 @@
+import argparse
+import os
+import time
+
+from bitboard import BitBoard
+from board import *
+
+# Perft counts leaf nodes of the full game tree to the given depth. Counts are compared with the stored ones
+# (any change in move generation shows up as a different number). Speed depends on the machine and its load,
+# so it's compared with the stored baseline only on request (--check-speed or PERFT_CHECK_SPEED=1) - on an idle
+# machine comparable to the reference one.
+
+# name: (board_repr, side to move, expected leaf nodes for depth 1, 2, 3...)
+PERFT_POSITIONS = {
+    "initial": (INITIAL_BOARD_REPR, Color.WHITE, (7, 49, 302, 1469, 7482)),
+    # white man can capture around a circle in both directions - both orders give the same position, it's one move
+    "multi_jump": ((0x8888888a, 0x88a8a888, 0x88888888, 0x88a8a888,
+                    0x88888888, 0x88a88828, 0x82888888, 0x88882888), Color.WHITE, (1, 1, 6, 12, 63, 83, 251)),
+    # flying king jumps over a piece and lands on any cell behind it
+    "king_captures": ((0x8b888888, 0x888888a8, 0x888a8888, 0x88888888,
+                       0x888b8888, 0x8888a888, 0x88888288, 0x38888888), Color.WHITE, (2, 7, 19, 151, 787, 7431)),
+    # white man passes the last row during its attack - it's promoted only if the attack ends there
+    "promotion_mid_capture": ((0x8a888888, 0x88a8a8a8, 0x82888888, 0x888888a8,
+                               0x88888b88, 0x88288888, 0x88828888, 0x28888888), Color.WHITE,
+                              (2, 2, 11, 71, 428, 2950)),
+    "black_multi_jump": ((0x88888a88, 0x88a88888, 0x88828888, 0x88888888,
+                          0x88828288, 0x88888888, 0x88838288, 0x88888828), Color.BLACK, (1, 2, 8, 12, 36, 56, 146)),
+}
+
+# (board class name, generator): leaf nodes per second measured on the reference machine
+PERFT_BASELINES = {
+    ("Board", "get_next_boards"): 16000,
+    ("Board", "iter_next_boards"): 16000,
+    ("Board", "make_unmake"): 100000,
+    ("BitBoard", "get_next_boards"): 190000,
+    ("BitBoard", "iter_next_boards"): 190000,
+    ("BitBoard", "make_unmake"): 245000,
+}
+PERFT_SPEED_TOLERANCE = 0.5  # slower than half of the baseline is a regression (machines differ)
+
+GENERATORS = ("get_next_boards", "iter_next_boards", "make_unmake")
+
+
+class PerftRegression(Exception):
+    """
+    Raised when perft counts differ from the expected ones or move generation got too slow
+    """
+    pass
+
+
+def perft(board, depth, generator="get_next_boards"):
+    """
+    :param generator: get_next_boards, iter_next_boards or make_unmake (get_legal_moves + make_move/unmake_move)
+    :return: number of positions reached after exactly depth moves
+    """
+    if depth == 0:
+        return 1
+    if generator == "make_unmake":
+        moves = board.get_legal_moves()
+        if depth == 1:
+            return len(moves)
+        result = 0
+        for move in moves:
+            record = board.make_move(move)
+            result += perft(board, depth - 1, generator)
+            board.unmake_move(move, record)
+        return result
+    if generator == "iter_next_boards":
+        next_boards = board.iter_next_boards()
+    else:
+        next_boards = board.get_next_boards()
+    if depth == 1:
+        return sum(1 for _ in next_boards)
+    return sum(perft(next_board, depth - 1, generator) for next_board in next_boards)
+
+
+def perft_divide(board, depth, generator="get_next_boards"):
+    """
+    Used to find the move generated wrongly
+    :return: list of (Move, number of positions reached after it)
+    """
+    return [(next_board.last_move, perft(next_board, depth - 1, generator))
+            for next_board in board.get_next_boards()]
+
+
+def run_perft_suite(board_class=Board, generator="get_next_boards", max_depth=None, check_speed=None):
+    """
+    Runs perft of every stored position and compares results with expected counts (and speed baseline)
+    :param max_depth: deepest depth checked, None for all stored ones
+    :param check_speed: if true too slow move generation is a regression too,
+                        None to check it only if environment variable PERFT_CHECK_SPEED is 1
+    :return: leaf nodes per second of the whole suite
+    """
+    if check_speed is None:
+        check_speed = os.environ.get("PERFT_CHECK_SPEED") == "1"
+    nodes = 0
+    elapsed_time = 0.0
+    for name, (board_repr, turn, expected_counts) in PERFT_POSITIONS.items():
+        for depth, expected in enumerate(expected_counts[:max_depth], start=1):
+            board = board_class(board_repr, turn)
+            start_time = time.perf_counter()
+            count = perft(board, depth, generator)
+            elapsed_time += time.perf_counter() - start_time
+            nodes += count
+            if count != expected:
+                raise PerftRegression(f"{board_class.__name__} {generator}: perft({name}, {depth}) = {count}, "
+                                      f"expected {expected}")
+            if board.board_repr != board_repr:
+                raise PerftRegression(f"{board_class.__name__} {generator}: perft({name}, {depth}) changed the board")
+
+    nodes_per_second = nodes / elapsed_time if elapsed_time > 0 else float("inf")
+    baseline = PERFT_BASELINES[(board_class.__name__, generator)]
+    print(f"perft {board_class.__name__} {generator}: nodes={nodes} time [s]: {elapsed_time:.3f} "
+          f"nodes/s={nodes_per_second:.0f} (baseline {baseline})")
+    if check_speed and nodes_per_second < baseline * PERFT_SPEED_TOLERANCE:
+        raise PerftRegression(f"{board_class.__name__} {generator}: {nodes_per_second:.0f} nodes/s "
+                              f"is below {PERFT_SPEED_TOLERANCE:.0%} of baseline {baseline} nodes/s")
+    return nodes_per_second
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks move generation by counting leaf nodes of stored positions")
+    parser.add_argument("--check-speed", action="store_true", help="fail also if slower than the baseline")
+    arguments = parser.parse_args()
+    for board_class in (Board, BitBoard):
+        for generator in GENERATORS:
+            run_perft_suite(board_class, generator, check_speed=arguments.check_speed or None)
+
+
+if __name__ == '__main__':
+    main()
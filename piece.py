@@ -25,6 +25,43 @@ def is_allowed_cell_on_board(row, column):
     return True
 
 
+# diagonal directions (delta row, delta column) in order moves of a king are listed in
+DIRECTIONS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+
+
+def _build_diagonal_rays():
+    """
+    Precomputed once - pieces look up cells instead of creating and validating candidate cells
+    :return: rays[row][column]: for every direction of DIRECTIONS tuple of cells from the nearest one to the edge
+    """
+    rays = [[None] * 8 for _ in range(8)]
+    for row in range(8):
+        for column in range(8):
+            cell_rays = []
+            for delta_row, delta_column in DIRECTIONS:
+                ray = []
+                ray_row, ray_column = row + delta_row, column + delta_column
+                while 0 <= ray_row <= 7 and 0 <= ray_column <= 7:
+                    ray.append((ray_row, ray_column))
+                    ray_row += delta_row
+                    ray_column += delta_column
+                cell_rays.append(tuple(ray))
+            rays[row][column] = tuple(cell_rays)
+    return rays
+
+
+RAYS = _build_diagonal_rays()
+# [row][column] -> cells a man can step to: white men move toward row 0, black ones toward row 7
+WHITE_MAN_STEPS = [[tuple(cell_rays[direction][0] for direction in (3, 2) if cell_rays[direction])
+                    for cell_rays in row_rays] for row_rays in RAYS]
+BLACK_MAN_STEPS = [[tuple(cell_rays[direction][0] for direction in (1, 0) if cell_rays[direction])
+                    for cell_rays in row_rays] for row_rays in RAYS]
+# [row][column] -> (cell of captured piece, cell after attack) of every jump of a man (men capture backwards too)
+MAN_JUMPS = [[tuple((cell_rays[direction][0], cell_rays[direction][1]) for direction in (3, 2, 1, 0)
+                    if len(cell_rays[direction]) > 1)
+              for cell_rays in row_rays] for row_rays in RAYS]
+
+
 class Piece(ABC):
     def __init__(self, row, column, board):
         if not is_allowed_cell_on_board(row, column):
@@ -49,21 +86,21 @@ class Piece(ABC):
         pass
 
     @property
+    @abstractmethod
     def possible_moves(self):
         """
         :return: list of all possible moves ( example: [(0,1), (0,3)] ) - moves are tuples (row,column)
         """
-        potential = self._potential_moves()
-        return [(row, col) for row, col in potential if self._can_move_to(row, col)]
+        pass
 
     @property
+    @abstractmethod
     def possible_attacks(self):
         """
         Note that function returns positions of piece after performing an attack!
         :return: list of all possible attacks ( example: [(0,1), (0,3)] ) - attacks are tuples (row,column)
         """
-        potential = self._potential_attacks()
-        return [(row, col) for row, col in potential if self._can_attack_to(row, col)]
+        pass
 
     def move_to(self, row_desired, column_desired):
         if not self._can_move_to(row_desired, column_desired):
@@ -71,9 +108,14 @@ class Piece(ABC):
         self._move_unsafely_to(row_desired, column_desired)
 
     def attack_to(self, row_desired, column_desired):
+        """
+        :return: captured piece
+        """
         if not self._can_attack_to(row_desired, column_desired):
             raise ValueError("Attack not allowed")
+        return self._attack_unsafely_to(row_desired, column_desired)
 
+    def _attack_unsafely_to(self, row_desired, column_desired):
         between_cells = self._get_cells_on_the_way_to(row_desired, column_desired)
 
         piece = None
@@ -88,6 +130,7 @@ class Piece(ABC):
 
         self._move_unsafely_to(row_desired, column_desired)
         self.board.delete_piece_at(row_attacked, column_attacked)
+        return piece
 
     @abstractmethod
     def get_representation(self):
@@ -180,14 +223,6 @@ class Piece(ABC):
 
         return result
 
-    @abstractmethod
-    def _potential_moves(self):
-        pass
-
-    @abstractmethod
-    def _potential_attacks(self):
-        pass
-
 
 class Man(Piece, ABC):
     def __init__(self, row, column, board):
@@ -211,14 +246,27 @@ class Man(Piece, ABC):
         board.set_piece_at(row, column, king)
         pass
 
+    @property
     @abstractmethod
-    def _potential_moves(self):
+    def _steps(self):
         """Can't implement it here, because white can only move up, and black can only move down"""
         pass
 
-    def _potential_attacks(self):
-        return [(self.row - 2, self.column - 2), (self.row - 2, self.column + 2),
-                (self.row + 2, self.column - 2), (self.row + 2, self.column + 2)]
+    @property
+    def possible_moves(self):
+        board = self.board
+        return [cell for cell in self._steps[self.row][self.column] if not board.is_there_piece_at(*cell)]
+
+    @property
+    def possible_attacks(self):
+        board = self.board
+        color = self.color
+        result = []
+        for (captured_row, captured_column), cell in MAN_JUMPS[self.row][self.column]:
+            piece = board.get_piece_at(captured_row, captured_column)
+            if piece is not None and piece.color != color and not board.is_there_piece_at(*cell):
+                result.append(cell)
+        return result
 
 
 class BlackMan(Man):
@@ -240,9 +288,10 @@ class BlackMan(Man):
     def get_representation(self):
         return 0x0000000a
 
-    def _potential_moves(self):
+    @property
+    def _steps(self):
         """Black are moving toward ascending row numbers"""
-        return [(self.row + 1, self.column - 1), (self.row + 1, self.column + 1)]
+        return BLACK_MAN_STEPS
 
 
 class WhiteMan(Man):
@@ -264,28 +313,59 @@ class WhiteMan(Man):
     def get_representation(self):
         return 0x00000002
 
-    def _potential_moves(self):
-        """Black are moving toward ascending row numbers"""
-        return [(self.row - 1, self.column - 1), (self.row - 1, self.column + 1)]
+    @property
+    def _steps(self):
+        """White are moving toward descending row numbers"""
+        return WHITE_MAN_STEPS
 
 
 class King(Piece, ABC):
     def __init__(self, row, column, board):
         super().__init__(row, column, board)
 
-    def _potential_attacks(self):
-        result = []
-        for i in (2, 3, 4, 5, 6, 7):
-            for row, col in [(i, i), (i, -i), (-i, i), (-i, -i)]:
-                result.append((self.row + row, self.column + col))
-        return result
+    @property
+    def possible_moves(self):
+        """
+        Every ray is followed until the first piece on it
+        :return: nearest cells first
+        """
+        board = self.board
+        free_rays = []
+        for ray in RAYS[self.row][self.column]:
+            distance = 0
+            for row, column in ray:
+                if board.is_there_piece_at(row, column):
+                    break
+                distance += 1
+            if distance:
+                free_rays.append(ray[:distance])
+        if not free_rays:
+            return []
+        return [ray[distance] for distance in range(max(map(len, free_rays))) for ray in free_rays
+                if distance < len(ray)]
 
-    def _potential_moves(self):
-        result = []
-        for i in (1, 2, 3, 4, 5, 6, 7):
-            for row, col in [(i, i), (i, -i), (-i, i), (-i, -i)]:
-                result.append((self.row + row, self.column + col))
-        return result
+    @property
+    def possible_attacks(self):
+        """
+        Every ray is followed until the first piece on it - the king can land on any free cell behind an opponent
+        :return: nearest cells first
+        """
+        board = self.board
+        color = self.color
+        attacks = []  # (distance, direction, cell after attack)
+        for direction, ray in enumerate(RAYS[self.row][self.column]):
+            for distance, (row, column) in enumerate(ray):
+                piece = board.get_piece_at(row, column)
+                if piece is None:
+                    continue
+                if piece.color != color:
+                    for landing_distance in range(distance + 1, len(ray)):
+                        if board.is_there_piece_at(*ray[landing_distance]):
+                            break
+                        attacks.append((landing_distance, direction, ray[landing_distance]))
+                break
+        attacks.sort()
+        return [cell for _, _, cell in attacks]
 
 
 class WhiteKing(King):
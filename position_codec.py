@@ -0,0 +1,157 @@
+from itertools import product
+
+from piece import Color
+
+# Compact format of positions for storing many of them (books, training data, caches).
+# position_key spends 4 bits on each of the 32 playable squares, but a square has only 5 states, so a row
+# (4 squares, 16 bits of position_key) is one of 5 ** 4 = 625 combinations and fits into 10 bits.
+# Code of a position: bits 10 * row .. 10 * row + 9 - number of the combination of the row (ROW_KEYS),
+# bit 80 - side to move (1 for black), bits 81-95 - zero. Stored as POSITION_SIZE bytes, little endian.
+
+POSITION_SIZE = 12
+ROW_BITS = 10
+TURN_BIT = 8 * ROW_BITS
+TURNS = (Color.WHITE, Color.BLACK)
+
+# number of the combination -> 16 bits of position_key of the row, and back
+ROW_KEYS = tuple(sum(representation << (4 * index) for index, representation in enumerate(representations))
+                 for representations in product((0x0, 0x2, 0x3, 0xa, 0xb), repeat=4))
+ROW_CODES = {row_key: code for code, row_key in enumerate(ROW_KEYS)}
+
+
+def encode_position(position_key, turn):
+    """
+    :param position_key: the position_key attribute of a board (Board or BitBoard)
+    :param turn: side to move
+    :return: code of the position (int of POSITION_SIZE bytes)
+    """
+    code = 1 << TURN_BIT if turn == Color.BLACK else 0
+    try:
+        for row in range(8):
+            code |= ROW_CODES[(position_key >> (16 * row)) & 0xFFFF] << (ROW_BITS * row)
+    except KeyError:
+        raise ValueError(f"{position_key:#x} is not a position_key") from None
+    return code
+
+
+def decode_position(code):
+    """
+    :return: (position_key, turn) of the code made by encode_position
+    """
+    if code >> (TURN_BIT + 1):
+        raise ValueError(f"{code:#x} is not a code of a position")
+    position_key = 0
+    try:
+        for row in range(8):
+            position_key |= ROW_KEYS[(code >> (ROW_BITS * row)) & 0x3FF] << (16 * row)
+    except IndexError:
+        raise ValueError(f"{code:#x} is not a code of a position") from None
+    return position_key, TURNS[code >> TURN_BIT]
+
+
+def encode_board(board):
+    """
+    :return: code of the board (Board or BitBoard)
+    """
+    return encode_position(board.position_key, board.turn)
+
+
+def decode_board(code, board_class, level=0):
+    """
+    :param board_class: Board or BitBoard
+    :return: board of the code made by encode_position
+    """
+    position_key, turn = decode_position(code)
+    return board_class.from_position_key(position_key, turn, level)
+
+
+def encode_positions(positions):
+    """
+    :param positions: iterable of (position_key, turn)
+    :return: bytes with POSITION_SIZE bytes of every position
+    """
+    return b"".join(encode_position(position_key, turn).to_bytes(POSITION_SIZE, "little")
+                    for position_key, turn in positions)
+
+
+def decode_positions(data):
+    """
+    :param data: bytes-like object made by encode_positions (e.g. content of a file or mmap)
+    :return: list of (position_key, turn)
+    """
+    if len(data) % POSITION_SIZE:
+        raise ValueError(f"size of data {len(data)} isn't a multiple of {POSITION_SIZE}")
+    data = memoryview(data)
+    return [decode_position(int.from_bytes(data[offset:offset + POSITION_SIZE], "little"))
+            for offset in range(0, len(data), POSITION_SIZE)]
+
+
+# NumPy variant: positions are packed the same way as by batch_evaluation.pack_position_keys (two uint64 - squares
+# 0-15 and 16-31) with separate array of turns (0 white, 1 black), so stored positions can be evaluated without
+# creating a single Python int.
+
+_numpy_tables_cache = None
+
+
+def _numpy_tables():
+    """
+    :return: (numpy module, ROW_KEYS array, array 16 bits of position_key -> ROW_CODES value or -1, record dtype)
+    """
+    global _numpy_tables_cache
+    if _numpy_tables_cache is None:
+        import numpy as np  # NumPy is needed only by the array functions
+        row_keys = np.array(ROW_KEYS, dtype=np.uint64)
+        row_codes = np.full(1 << 16, -1, dtype=np.int64)
+        row_codes[row_keys.astype(np.intp)] = np.arange(len(ROW_KEYS))
+        record = np.dtype([("low", "<u8"), ("high", "<u4")])  # bits 0-63 and 64-95 of the code
+        _numpy_tables_cache = (np, row_keys, row_codes, record)
+    return _numpy_tables_cache
+
+
+def decode_array(data):
+    """
+    :param data: bytes-like object made by encode_positions or encode_array
+    :return: (array of shape (positions, 2) of uint64 like batch_evaluation.pack_position_keys,
+              array of turns: 0 white to move, 1 black)
+    """
+    np, row_keys, _, record = _numpy_tables()
+    if len(data) % POSITION_SIZE:
+        raise ValueError(f"size of data {len(data)} isn't a multiple of {POSITION_SIZE}")
+    records = np.frombuffer(data, dtype=record)
+    low = records["low"]
+    high = records["high"].astype(np.uint64)
+    row_mask = np.uint64(0x3FF)
+    codes = [(low >> np.uint64(ROW_BITS * row)) & row_mask for row in range(6)]
+    codes.append(((low >> np.uint64(60)) | (high << np.uint64(4))) & row_mask)  # row 6 crosses the two words
+    codes.append((high >> np.uint64(6)) & row_mask)
+    if any((row_code >= len(ROW_KEYS)).any() for row_code in codes) \
+            or (high >> np.uint64(TURN_BIT - 64 + 1)).any():
+        raise ValueError("data contains codes which aren't codes of positions")
+    packed = np.zeros((len(records), 2), dtype=np.uint64)
+    for row, row_code in enumerate(codes):
+        packed[:, row // 4] |= row_keys[row_code.astype(np.intp)] << np.uint64(16 * (row % 4))
+    return packed, ((high >> np.uint64(TURN_BIT - 64)) & np.uint64(1)).astype(np.uint8)
+
+
+def encode_array(packed, turns):
+    """
+    :param packed: array of shape (positions, 2) of uint64 like batch_evaluation.pack_position_keys
+    :param turns: array of turns: 0 white to move, 1 black
+    :return: bytes with POSITION_SIZE bytes of every position (the same as encode_positions makes)
+    """
+    np, _, row_codes, record = _numpy_tables()
+    packed = np.asarray(packed, dtype=np.uint64)
+    codes = [row_codes[((packed[:, row // 4] >> np.uint64(16 * (row % 4))) & np.uint64(0xFFFF)).astype(np.intp)]
+             for row in range(8)]
+    if any((row_code < 0).any() for row_code in codes):
+        raise ValueError("packed contains values which aren't position keys")
+    codes = [row_code.astype(np.uint64) for row_code in codes]
+    records = np.zeros(len(packed), dtype=record)
+    low = np.zeros(len(packed), dtype=np.uint64)
+    for row in range(6):
+        low |= codes[row] << np.uint64(ROW_BITS * row)
+    low |= codes[6] << np.uint64(60)  # the lowest 4 bits of row 6, the rest goes to the high word
+    records["low"] = low
+    records["high"] = (codes[6] >> np.uint64(4)) | (codes[7] << np.uint64(6)) \
+        | (np.asarray(turns, dtype=np.uint64) << np.uint64(TURN_BIT - 64))
+    return records.tobytes()
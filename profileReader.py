@@ -1,21 +1,199 @@
+import argparse
+import cProfile
+import json
+import os
 import pstats
+import time
+from collections import defaultdict
+
+from bitboard import BitBoard
+from perft import PERFT_POSITIONS
+from search_algorithm import *
 
 
 def main():
-    ProfileReader.read_print_stats()
+    parser = argparse.ArgumentParser(description="Profiles the search on fixed positions and compares profiles")
+    parser.add_argument("--directory", default=PROFILES_DIRECTORY, help="directory of saved profiles")
+    subparsers = parser.add_subparsers(dest="command")
+    run_parser = subparsers.add_parser("run", help="profile the workload and save the profile under the name")
+    run_parser.add_argument("name")
+    run_parser.add_argument("--depth", type=int, default=5)
+    run_parser.add_argument("--positions", nargs="*", default=list(PERFT_POSITIONS), choices=list(PERFT_POSITIONS))
+    run_parser.add_argument("--board", choices=["board", "bitboard"], default="board")
+    run_parser.add_argument("--make-unmake", action="store_true")
+    show_parser = subparsers.add_parser("show", help="print saved profile")
+    show_parser.add_argument("name", nargs="?", default=None)
+    show_parser.add_argument("--sort", default="tottime")
+    diff_parser = subparsers.add_parser("diff", help="compare two saved profiles")
+    diff_parser.add_argument("before")
+    diff_parser.add_argument("after")
+    arguments = parser.parse_args()
+
+    if arguments.command == "run":
+        board_class = BitBoard if arguments.board == "bitboard" else Board
+        ProfileReader.run_workload(arguments.name, arguments.positions, arguments.depth, board_class,
+                                   arguments.make_unmake, arguments.directory)
+        ProfileReader.read_print_stats(arguments.name, directory=arguments.directory)
+    elif arguments.command == "show" and arguments.name is not None:
+        ProfileReader.read_print_stats(arguments.name, arguments.sort, directory=arguments.directory)
+    elif arguments.command == "diff":
+        ProfileReader.print_diff(arguments.before, arguments.after, directory=arguments.directory)
+    else:
+        ProfileReader.read_print_stats()
+
+
+# najpierw odpalasz komende np taka:     python3 profileReader.py run przed
+# potem po zmianach w kodzie:            python3 profileReader.py run po
+# i porownujesz:                         python3 profileReader.py diff przed po
+# widzisz w ktorych funkcjach program spedzil najwiecej czasu i ktore przyspieszyly albo zwolnily
+# (stary sposob nadal dziala: python3 -m cProfile -o profiling_results board.py, potem python3 profileReader.py)
+
+PROFILES_DIRECTORY = "profiles"  # default directory of saved profiles
+
+# phase name: methods of the board class whose time (including called functions) is counted to the phase
+PHASE_METHODS = {
+    "move generation": ("get_legal_moves", "get_next_boards", "iter_next_boards"),
+    "board copying": ("copy",),
+    "evaluation": ("balance",),
+    "terminal detection": ("did_game_end",),
+}
+
+
+class PhaseTimers:
+    """
+    While active, wraps methods of the board class listed in PHASE_METHODS with timers.
+    Time of a phase includes everything called inside of it (copying done during generation counts to both).
+    """
+
+    def __init__(self, board_class):
+        self.board_class = board_class
+        self.times = defaultdict(float)
+        self.calls = defaultdict(int)
+        self._originals = {}
+
+    def __enter__(self):
+        for phase, method_names in PHASE_METHODS.items():
+            for method_name in method_names:
+                original = self.board_class.__dict__.get(method_name)
+                if original is None:
+                    continue
+                self._originals[method_name] = original
+                if isinstance(original, property):
+                    setattr(self.board_class, method_name, property(self._timed(phase, original.fget)))
+                else:
+                    setattr(self.board_class, method_name, self._timed(phase, original))
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        for method_name, original in self._originals.items():
+            setattr(self.board_class, method_name, original)
+        self._originals = {}
+
+    def _timed(self, phase, function):
+        times = self.times
+        calls = self.calls
+
+        def timed(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                times[phase] += time.perf_counter() - start_time
+                calls[phase] += 1
+
+        return timed
 
+    def as_dict(self):
+        return {phase: {"time": self.times[phase], "calls": self.calls[phase]} for phase in PHASE_METHODS}
 
-# najpierw odpalasz komende np taka:     python3 -m cProfile -o profiling_results board.py
-# potem:                                 python3 profileReader.py
-# widzisz w ktorych funkacjach program spedzil najwiecej czasu
 
 class ProfileReader:
     @staticmethod
-    def read_print_stats():
-        stats = pstats.Stats("profiling_results")
-        # stats.sort_stats("cumtime")  # całkowity czas spedzony w funkcji i jej wywołaniach
-        stats.sort_stats("tottime")  # czas spędzony tylko w tej funkcji
-        stats.print_stats(30)
+    def profile_path(name, directory=PROFILES_DIRECTORY):
+        return os.path.join(directory, name + ".prof")
+
+    @staticmethod
+    def phases_path(name, directory=PROFILES_DIRECTORY):
+        return os.path.join(directory, name + ".phases.json")
+
+    @staticmethod
+    def run_workload(name, position_names=tuple(PERFT_POSITIONS), depth=5, board_class=Board, make_unmake=False,
+                     directory=PROFILES_DIRECTORY):
+        """
+        Searches every position with alpha-beta under cProfile, then once more with phase timers
+        (timers slow the search down, so they aren't part of the cProfile run)
+        :param position_names: keys of perft.PERFT_POSITIONS
+        :param directory: where the profile is saved (created if it doesn't exist)
+        :return: (pstats.Stats, dict of phase timers)
+        """
+        os.makedirs(directory, exist_ok=True)
+        states = [State(board_class(*PERFT_POSITIONS[position_name][:2])) for position_name in position_names]
+
+        profile = cProfile.Profile()
+        start_time = time.time()
+        profile.enable()
+        for state in states:
+            SearchAlgorithm(make_unmake=make_unmake).alpha_beta(state, depth)
+        profile.disable()
+        elapsed_time = time.time() - start_time
+        profile.dump_stats(ProfileReader.profile_path(name, directory))
+
+        states = [State(board_class(*PERFT_POSITIONS[position_name][:2])) for position_name in position_names]
+        with PhaseTimers(board_class) as timers:
+            for state in states:
+                SearchAlgorithm(make_unmake=make_unmake).alpha_beta(state, depth)
+        phases = {"workload": {"positions": list(position_names), "depth": depth, "board": board_class.__name__,
+                               "make_unmake": make_unmake, "time": elapsed_time},
+                  "phases": timers.as_dict()}
+        with open(ProfileReader.phases_path(name, directory), "w") as phases_file:
+            json.dump(phases, phases_file, indent=2)
+
+        print(f"profile '{name}' saved, workload time [s]: {elapsed_time:.3f}")
+        for phase, phase_timer in phases["phases"].items():
+            print(f"{phase:>20}: {phase_timer['time']:.3f} s in {phase_timer['calls']} calls")
+        return pstats.Stats(ProfileReader.profile_path(name, directory)), phases
+
+    @staticmethod
+    def read_print_stats(name=None, sort="tottime", limit=30, directory=PROFILES_DIRECTORY):
+        """
+        :param name: name of saved profile, None for "profiling_results" file made by python -m cProfile
+        :param sort: tottime - czas spędzony tylko w tej funkcji, cumtime - całkowity czas spedzony w funkcji
+                     i jej wywołaniach
+        """
+        stats = pstats.Stats("profiling_results" if name is None else ProfileReader.profile_path(name, directory))
+        stats.sort_stats(sort)
+        stats.print_stats(limit)
+
+    @staticmethod
+    def diff(before, after, directory=PROFILES_DIRECTORY):
+        """
+        :param before: name of saved profile
+        :param after: name of saved profile
+        :return: list of (function, tottime before, tottime after) sorted by the biggest change first
+        """
+        before_stats = pstats.Stats(ProfileReader.profile_path(before, directory)).stats
+        after_stats = pstats.Stats(ProfileReader.profile_path(after, directory)).stats
+        result = []
+        for function in set(before_stats) | set(after_stats):
+            # stats values: (primitive calls, calls, tottime, cumtime, callers)
+            before_time = before_stats[function][2] if function in before_stats else 0.0
+            after_time = after_stats[function][2] if function in after_stats else 0.0
+            result.append((pstats.func_std_string(function), before_time, after_time))
+        result.sort(key=lambda row: abs(row[2] - row[1]), reverse=True)
+        return result
+
+    @staticmethod
+    def print_diff(before, after, limit=30, directory=PROFILES_DIRECTORY):
+        for label, name in (("before", before), ("after", after)):
+            if os.path.exists(ProfileReader.phases_path(name, directory)):
+                with open(ProfileReader.phases_path(name, directory)) as phases_file:
+                    phases = json.load(phases_file)
+                print(f"{label} ({name}): workload time [s]: {phases['workload']['time']:.3f} " +
+                      " ".join(f"{phase}={timer['time']:.3f}" for phase, timer in phases["phases"].items()))
+        print(f"{'before [s]':>12}{'after [s]':>12}{'change':>10}  function")
+        for function, before_time, after_time in ProfileReader.diff(before, after, directory)[:limit]:
+            change = f"{(after_time - before_time) / before_time:+.0%}" if before_time else "new"
+            print(f"{before_time:12.4f}{after_time:12.4f}{change:>10}  {function}")
 
 
 if __name__ == '__main__':
@@ -1,34 +1,544 @@
+import time
+
 from state import *
+from transposition_table import *
+from search_statistics import SearchStatistics
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside of the search when its time or node budget is exhausted
+    """
+    pass
+
+
+# priorities of moves during ordering, history scores stay below killer moves
+HASH_MOVE_SCORE = 4000000
+PRINCIPAL_MOVE_SCORE = 3000000
+CAPTURE_SCORE = 2000000
+PROMOTION_SCORE = 1000000
+KILLER_MOVE_SCORE = 900000
+HISTORY_SCORE_LIMIT = 800000
+
+NULL_WINDOW = 0.001  # width of the window of principal variation search, below the resolution of the evaluation
 
 
 class SearchAlgorithm:
 
+    def __init__(self, transposition_table=None, move_ordering=True, make_unmake=False, tablebase=None,
+                 batch_evaluation=False, quiescence=False, quiescence_node_limit=1000,
+                 principal_variation_search=False, aspiration_window=None, mtdf=False):
+        """
+        :param transposition_table: TranspositionTable reused by searches, None to search without it
+        :param move_ordering: if false children are searched in order they are generated in
+        :param make_unmake: if true the tree is walked by making and reverting moves on the root's board
+                            instead of copying a board for every child
+        :param tablebase: Tablebase giving exact values of positions with few pieces, None to search without it
+        :param batch_evaluation: if true children of nodes one ply above the leaves are evaluated in one call
+                                 (requires NumPy)
+        :param quiescence: if true leaves where the side to move has to capture are searched further
+                           (only captures are legal there) until the position is quiet
+        :param quiescence_node_limit: nodes the quiescence search of a single leaf may visit,
+                                      positions beyond it are evaluated as they are
+        :param principal_variation_search: if true only the first child is searched with the full window,
+                                           the rest are just tested with a null window (re-searched if they're better)
+        :param aspiration_window: iterative deepening searches with the window of +- aspiration_window around
+                                  the value of the previous iteration (widened if the value falls outside),
+                                  None for the full window
+        :param mtdf: find the value by a sequence of null window searches (MTD(f)) starting from the value of
+                     the previous iteration of iterative deepening, requires transposition_table
+        """
+        if mtdf and transposition_table is None:
+            raise ValueError("MTD(f) requires a transposition table")
+        self.transposition_table = transposition_table
+        self.tablebase = tablebase
+        self.move_ordering = move_ordering
+        self.make_unmake = make_unmake
+        self.quiescence = quiescence
+        self.quiescence_node_limit = quiescence_node_limit
+        self._quiescence_nodes_left = 0
+        self.principal_variation_search = principal_variation_search
+        self.aspiration_window = aspiration_window
+        self.mtdf = mtdf
+        self._evaluate_position_keys = None
+        if batch_evaluation:
+            from batch_evaluation import evaluate_position_keys  # NumPy is needed only in this mode
+            self._evaluate_position_keys = evaluate_position_keys
+        self.nodes = 0
+        self.completed_depth = 0
+        self.statistics = SearchStatistics()  # statistics of the last search
+        self._deadline = None
+        self._node_limit = None
+        self._principal_variation = []  # Move.key of best moves found by the previous iteration, per ply
+        self._killer_moves = []  # per ply: Move.key of last two quiet moves which caused a cutoff
+        self._history = [[0] * 4096, [0] * 4096]  # per color and Move.key of quiet move: cutoffs it caused
+        self._warm_start = False  # ordering data is carried over from the previous search (see advance)
+
     def alpha_beta(self, root_state, depth):
-        return self._alpha_beta(root_state, depth, -999999, 999999)
+        """
+        :return: value of the root (root_state.next_move is its best move), see self.statistics for details
+        """
+        self._start_search()
+        self._deadline = None
+        self._node_limit = None
+        if self.mtdf:
+            result = self._mtdf(root_state, depth, root_state.balance)
+        else:
+            result = self._alpha_beta(root_state, depth, -999999, 999999)
+        self.completed_depth = depth
+        self._principal_variation = self._get_principal_variation(root_state)
+        self.statistics.finish(result, depth, self._get_decision_chain_moves(root_state))
+        return result
+
+    def advance(self, move):
+        """
+        Called after the move was made in the game - keeps results of the last search for the next one:
+        the principal variation and killer moves are shifted by one ply, history scores are halved
+        and the transposition table is kept. Otherwise every search starts from scratch.
+        :param move: Move made from the root of the last search
+        :return: -
+        """
+        if self._principal_variation and self._principal_variation[0] == move.key:
+            self._principal_variation = self._principal_variation[1:]
+        else:
+            self._principal_variation = []
+        self._killer_moves = self._killer_moves[1:]
+        self._history = [[score // 2 for score in history] for history in self._history]
+        self._warm_start = True
+
+    def iterative_deepening(self, root_state, max_depth, time_limit=None, node_limit=None):
+        """
+        Searches with depth 1, 2, 3... until max_depth is reached or the budget is exhausted.
+        Depth 1 is always completed, so there's always a move to make.
+        :param time_limit: seconds the search may take, None for no limit
+        :param node_limit: number of visited nodes the search may take, None for no limit
+        :return: value of the last completed iteration (root_state.next_move is its best move),
+                 see self.statistics for details
+        """
+        self._start_search()
+        self.completed_depth = 0
+        start_time = time.time()
+        result = root_state.balance
 
-    def _alpha_beta(self, root_state, depth, alpha, beta):
+        for depth in range(1, max_depth + 1):
+            if depth > 1:  # budget is checked only after the first iteration
+                self._deadline = start_time + time_limit if time_limit is not None else None
+                self._node_limit = node_limit
+            previous_chain = self._get_decision_chain(root_state)
+            previous_nodes = self.nodes
+            try:
+                if self.mtdf:
+                    result = self._mtdf(root_state, depth, result)
+                elif self.aspiration_window is not None and depth > 1:
+                    result = self._aspiration_search(root_state, depth, result)
+                else:
+                    result = self._alpha_beta(root_state, depth, -999999, 999999)
+            except SearchTimeout:
+                for state, next_state in previous_chain:  # cached children could be changed too, not only the root
+                    state.next_move = next_state
+                break
+            self.completed_depth = depth
+            self.statistics.nodes_per_iteration.append(self.nodes - previous_nodes)
+            self._principal_variation = self._get_principal_variation(root_state)
+            if root_state.is_terminal:
+                break
+
+        self._deadline = None
+        self._node_limit = None
+        self.statistics.finish(result, self.completed_depth, self._get_decision_chain_moves(root_state))
+        return result
+
+    def _aspiration_search(self, root_state, depth, expected):
+        """
+        Searches with a narrow window around the expected value, the window is widened (twice as much every time)
+        on the side the value fell out of until the value is inside of it
+        :return: value of the root
+        """
+        width = self.aspiration_window
+        alpha, beta = expected - width, expected + width
+        while True:
+            result = self._alpha_beta(root_state, depth, alpha, beta)
+            if alpha < result < beta or (alpha <= -999999 and beta >= 999999):
+                return result
+            self.statistics.aspiration_failures += 1
+            width *= 2
+            if result <= alpha:
+                alpha = expected - width if expected - width > -1000 else -999999
+            else:
+                beta = expected + width if expected + width < 1000 else 999999
+
+    def _mtdf(self, root_state, depth, first_guess):
+        """
+        MTD(f): every null window search tells whether the value is above or below the guess and gives a new guess,
+        until the lower and upper bounds meet. Subtrees searched by the previous passes come from the
+        transposition table. root_state.next_move is set by the last search which failed high.
+        :return: value of the root
+        """
+        value = first_guess
+        lower_bound, upper_bound = -999999, 999999
+        while lower_bound < upper_bound:
+            beta = max(value, lower_bound + NULL_WINDOW)
+            self.statistics.mtdf_passes += 1
+            value = self._alpha_beta(root_state, depth, beta - NULL_WINDOW, beta)
+            if value < beta:
+                upper_bound = value
+            else:
+                lower_bound = value
+        return value
+
+    def _alpha_beta(self, root_state, depth, alpha, beta, ply=0):
+        self.nodes += 1
+        statistics = self.statistics
+        statistics.count_node(ply)
+        if ply > 0:
+            root_state.next_move = None  # might be left by the previous search if the state is cached
+        if self._node_limit is not None and self.nodes > self._node_limit:
+            raise SearchTimeout()
+        if self._deadline is not None and time.time() > self._deadline:
+            raise SearchTimeout()
+
+        if depth <= 0 and self.quiescence and not root_state.is_terminal:
+            self._quiescence_nodes_left = self.quiescence_node_limit
+            return self._quiescence(root_state, alpha, beta, ply)
         if depth <= 0 or root_state.is_terminal:
+            statistics.leaf_evaluations += 1
             return root_state.balance
 
-        if root_state.turn == Color.WHITE:  # assuming white = player & black = opponent
-            for child_state in root_state.next_states:
-
-                alpha_beta = self._alpha_beta(child_state, depth - 1, alpha, beta)
+        # the root always has to be searched - its next_move is the answer
+        if self.tablebase is not None and ply > 0:
+            value = self.tablebase.probe(root_state.key, root_state.turn)
+            if value is not None:
+                statistics.tablebase_hits += 1
+                return value
 
-                if alpha_beta > alpha:
-                    alpha = alpha_beta
-                    root_state.next_move = child_state
-                if alpha >= beta:
-                    return beta
-            return alpha
+        table = self.transposition_table
+        hash_move_key = None
+        if table is not None:
+            entry = table.probe(root_state.zobrist_hash)
+            if entry is not None:
+                entry_depth, value, bound, hash_move_key = entry
+                if entry_depth >= depth and ply > 0:
+                    if bound == EXACT:
+                        return value
+                    if bound == LOWER_BOUND and value > alpha:
+                        alpha = value
+                    elif bound == UPPER_BOUND and value < beta:
+                        beta = value
+                    if alpha >= beta:
+                        return value
+        alpha_original, beta_original = alpha, beta
+        best_child = None
+        if depth == 1 and self._evaluate_position_keys is not None and not self.quiescence:
+            result, best_child = self._search_frontier(root_state, alpha, beta, ply, hash_move_key)
         else:
-            for child_state in root_state.next_states:
+            children = self._children(root_state, ply, hash_move_key)
+
+            try:
+                # fail-soft: result is the best value found even if it's outside of the window
+                # (it's a tighter bound stored in the transposition table)
+                if root_state.turn == Color.WHITE:  # assuming white = player & black = opponent
+                    result = -999999
+                    for index, child_state in enumerate(children):
+
+                        if index and self.principal_variation_search and beta - alpha > NULL_WINDOW:
+                            alpha_beta = self._alpha_beta(child_state, depth - 1, alpha, alpha + NULL_WINDOW, ply + 1)
+                            if alpha < alpha_beta < beta:  # better than the best child - the exact value is needed
+                                statistics.re_searches += 1
+                                alpha_beta = self._alpha_beta(child_state, depth - 1, alpha, beta, ply + 1)
+                        else:
+                            alpha_beta = self._alpha_beta(child_state, depth - 1, alpha, beta, ply + 1)
+
+                        if alpha_beta > result:
+                            result = alpha_beta
+                        if alpha_beta > alpha:
+                            alpha = alpha_beta
+                            root_state.next_move = child_state
+                            best_child = child_state
+                        if alpha >= beta:
+                            self._remember_cutoff(child_state.move, root_state.turn, depth, ply)
+                            statistics.cutoffs += 1
+                            statistics.first_move_cutoffs += index == 0
+                            break
+                else:
+                    result = 999999
+                    for index, child_state in enumerate(children):
 
-                alpha_beta = self._alpha_beta(child_state, depth - 1, alpha, beta)
+                        if index and self.principal_variation_search and beta - alpha > NULL_WINDOW:
+                            alpha_beta = self._alpha_beta(child_state, depth - 1, beta - NULL_WINDOW, beta, ply + 1)
+                            if alpha < alpha_beta < beta:
+                                statistics.re_searches += 1
+                                alpha_beta = self._alpha_beta(child_state, depth - 1, alpha, beta, ply + 1)
+                        else:
+                            alpha_beta = self._alpha_beta(child_state, depth - 1, alpha, beta, ply + 1)
 
-                if alpha_beta < beta:
-                    beta = alpha_beta
+                        if alpha_beta < result:
+                            result = alpha_beta
+                        if alpha_beta < beta:
+                            beta = alpha_beta
+                            root_state.next_move = child_state
+                            best_child = child_state
+                        if alpha >= beta:
+                            self._remember_cutoff(child_state.move, root_state.turn, depth, ply)
+                            statistics.cutoffs += 1
+                            statistics.first_move_cutoffs += index == 0
+                            break
+            finally:
+                children.close()  # with make_unmake: reverts the last made move
+
+        if table is not None:
+            if result <= alpha_original:
+                bound = UPPER_BOUND
+            elif result >= beta_original:
+                bound = LOWER_BOUND
+            else:
+                bound = EXACT
+            table.store(root_state.zobrist_hash, depth, result, bound,
+                        best_child.move.key if best_child is not None else None)
+        return result
+
+    def _quiescence(self, root_state, alpha, beta, ply):
+        """
+        Searches captures from a leaf until the side to move doesn't have to capture. Captures are mandatory,
+        so there's no standing pat - all legal moves of a position with a capture are searched.
+        :return: value of the position (fail-soft like _alpha_beta)
+        """
+        statistics = self.statistics
+        if root_state.is_terminal:
+            statistics.leaf_evaluations += 1
+            return root_state.balance
+        moves = root_state._board.get_legal_moves()
+        if not moves[0].captured_count:  # quiet position
+            statistics.leaf_evaluations += 1
+            return root_state.balance
+        if self._quiescence_nodes_left < len(moves):
+            statistics.quiescence_limit_hits += 1
+            statistics.leaf_evaluations += 1
+            return root_state.balance
+        self._quiescence_nodes_left -= len(moves)
+
+        is_white = root_state.turn == Color.WHITE
+        result = -999999 if is_white else 999999
+        children = self._children(root_state, ply, None, moves)
+        try:
+            for child_state in children:
+                self.nodes += 1
+                statistics.quiescence_nodes += 1
+                child_state.next_move = None
+                if self._node_limit is not None and self.nodes > self._node_limit:
+                    raise SearchTimeout()
+                if self._deadline is not None and time.time() > self._deadline:
+                    raise SearchTimeout()
+                value = self._quiescence(child_state, alpha, beta, ply + 1)
+                if (is_white and value > result) or (not is_white and value < result):
+                    result = value
+                if is_white and value > alpha:
+                    alpha = value
+                    root_state.next_move = child_state
+                elif not is_white and value < beta:
+                    beta = value
                     root_state.next_move = child_state
                 if alpha >= beta:
-                    return alpha
-            return beta
+                    statistics.quiescence_cutoffs += 1
+                    break
+        finally:
+            children.close()
+        return result
+
+    def _search_frontier(self, root_state, alpha, beta, ply, hash_move_key):
+        """
+        Searches node one ply above the leaves: all children are generated first and evaluated in one call,
+        then they're visited like by _alpha_beta (the same value, cutoffs and statistics). Leaves aren't probed
+        in the tablebase, the same as by _alpha_beta.
+        :return: (value, best child state or None)
+        """
+        statistics = self.statistics
+        board = root_state._board
+        moves = self._ordered_moves(board.get_legal_moves(), root_state.turn, ply, hash_move_key)
+        position_keys = []
+        child_values = []  # value of terminal child, None if it has to be evaluated
+        for move in moves:
+            if self.make_unmake:
+                record = board.make_move(move)
+                child_board = board
+            else:
+                child_board = board.get_board_after(move)
+            position_keys.append(child_board.position_key)
+            child_values.append((-1000 if child_board.turn == Color.WHITE else 1000)
+                                if child_board.did_game_end() else None)
+            if self.make_unmake:
+                board.unmake_move(move, record)
+        evaluated = self._evaluate_position_keys(position_keys)
+
+        is_white = root_state.turn == Color.WHITE
+        result = -999999 if is_white else 999999
+        best_move = None
+        for index, move in enumerate(moves):
+            self.nodes += 1
+            statistics.count_node(ply + 1)
+            if self._node_limit is not None and self.nodes > self._node_limit:
+                raise SearchTimeout()
+            if self._deadline is not None and time.time() > self._deadline:
+                raise SearchTimeout()
+            value = child_values[index]
+            if value is None:
+                value = float(evaluated[index])
+            statistics.leaf_evaluations += 1
+            if (is_white and value > result) or (not is_white and value < result):
+                result = value
+            if is_white and value > alpha:
+                alpha = value
+                best_move = move
+            elif not is_white and value < beta:
+                beta = value
+                best_move = move
+            if alpha >= beta:
+                self._remember_cutoff(move, root_state.turn, 1, ply)
+                statistics.cutoffs += 1
+                statistics.first_move_cutoffs += index == 0
+                break
+
+        best_child = None
+        if best_move is not None:
+            best_child = State(board.get_board_after(best_move))
+            best_child.clean_cached_board()
+            root_state.next_move = best_child
+        return result, best_child
+
+    def _start_search(self):
+        if self.transposition_table is not None:
+            self.transposition_table.new_search()
+        self.nodes = 0
+        self.statistics = SearchStatistics()
+        if not self._warm_start:
+            self._principal_variation = []
+            self._killer_moves = []
+            self._history = [[0] * 4096, [0] * 4096]
+        self._warm_start = False
+
+    def _children(self, state, ply, hash_move_key, moves=None):
+        """
+        Generates child states in order they should be searched in.
+        Board of a child is dropped once the child is searched (only its packed position key stays in the tree).
+        With make_unmake children share the board of the state - it's in the child's position only until
+        the next child is requested.
+        :param moves: legal moves of the state if they're already generated
+        """
+        board = state._board
+        if moves is None and (self.make_unmake or State.successor_cache is None):
+            moves = board.get_legal_moves()
+        if not self.make_unmake:
+            if State.successor_cache is not None:
+                child_states = self._ordered(state.next_states, state.turn, ply, hash_move_key)
+            else:  # children are created lazily - a cutoff spares creating the rest of them
+                child_states = (State(board.get_board_after(move))
+                                for move in self._ordered_moves(moves, state.turn, ply, hash_move_key))
+            for child_state in child_states:
+                try:
+                    yield child_state
+                finally:
+                    child_state.clean_cached_board()
+            return
+
+        for move in self._ordered_moves(moves, state.turn, ply, hash_move_key):
+            record = board.make_move(move)
+            child_state = State(board)
+            try:
+                yield child_state
+            finally:
+                child_state.clean_cached_board()
+                board.unmake_move(move, record)
+
+    def _ordered(self, child_states, turn, ply, hash_move_key):
+        """
+        :return: list of child states in order they should be searched in
+        """
+        if not self.move_ordering:
+            return child_states
+        score = self._move_scorer(turn, ply, hash_move_key)
+        return sorted(child_states, key=lambda child_state: score(child_state.move), reverse=True)
+
+    def _ordered_moves(self, moves, turn, ply, hash_move_key):
+        """
+        :return: list of moves in order they should be searched in
+        """
+        if not self.move_ordering:
+            return moves
+        return sorted(moves, key=self._move_scorer(turn, ply, hash_move_key), reverse=True)
+
+    def _move_scorer(self, turn, ply, hash_move_key):
+        """
+        Orders moves: transposition table move, move of the previous iteration at this ply,
+        captures (more captured pieces first), promotions, killer moves and then by history score
+        :return: function giving priority of a move (higher first)
+        """
+        principal_move_key = self._principal_variation[ply] if ply < len(self._principal_variation) else None
+        killer_moves = self._killer_moves[ply] if ply < len(self._killer_moves) else ()
+        history = self._history[turn.value]
+
+        def score(move):
+            key = move.key
+            if key == hash_move_key:
+                return HASH_MOVE_SCORE
+            if key == principal_move_key:
+                return PRINCIPAL_MOVE_SCORE
+            if move.captured_count:
+                return CAPTURE_SCORE + 2 * move.captured_count + move.promotion
+            if move.promotion:
+                return PROMOTION_SCORE
+            if key in killer_moves:
+                return KILLER_MOVE_SCORE + (key == killer_moves[0])
+            return history[key]
+
+        return score
+
+    def _remember_cutoff(self, move, turn, depth, ply):
+        """
+        Quiet move refuted the position - it's likely to do the same in its siblings
+        :return: -
+        """
+        if move.captured_count:
+            return
+        while len(self._killer_moves) <= ply:
+            self._killer_moves.append([])
+        killer_moves = self._killer_moves[ply]
+        if move.key not in killer_moves:
+            killer_moves.insert(0, move.key)
+            del killer_moves[2:]
+        history = self._history[turn.value]
+        history[move.key] = min(history[move.key] + depth * depth, HISTORY_SCORE_LIMIT - 1)
+
+    @staticmethod
+    def _get_decision_chain(root_state):
+        """
+        :return: (state, its next_move) of every state in the decision chain, the root included
+        """
+        result = []
+        state = root_state
+        while state is not None:
+            result.append((state, state.next_move))
+            state = state.next_move
+        return result
+
+    @staticmethod
+    def _get_decision_chain_moves(root_state):
+        """
+        :return: Move of every state in the decision chain
+        """
+        result = []
+        state = root_state.next_move
+        while state is not None:
+            result.append(state.move)
+            state = state.next_move
+        return result
+
+    @staticmethod
+    def _get_principal_variation(root_state):
+        """
+        :return: Move.key of every move in the decision chain
+        """
+        result = []
+        state = root_state.next_move
+        while state is not None:
+            result.append(state.move.key)
+            state = state.next_move
+        return result
@@ -0,0 +1,121 @@
+import time
+
+
+class SearchStatistics:
+    """
+    Describes the last search: how many nodes it visited on every ply, how well moves were ordered, how long it
+    took and what it found
+    """
+
+    def __init__(self):
+        self.value = None
+        self.depth = 0  # the deepest completed depth
+        self.principal_variation = []  # Move objects of the decision chain
+        self.nodes_per_ply = []  # nodes visited at every distance from the root
+        self.nodes_per_iteration = []  # nodes visited by every completed iteration of iterative deepening
+        self.leaf_evaluations = 0  # nodes whose value was taken from the evaluation (depth 0 or terminal)
+        self.tablebase_hits = 0  # nodes whose value was taken from the endgame tablebase
+        self.quiescence_nodes = 0  # nodes visited by the quiescence search below the leaves of the main search
+        self.quiescence_cutoffs = 0
+        self.quiescence_limit_hits = 0  # positions left unresolved because quiescence_node_limit was reached
+        self.cutoffs = 0
+        self.re_searches = 0  # children of principal variation search which failed high on the null window
+        self.aspiration_failures = 0  # iterations whose value fell outside of the aspiration window
+        self.mtdf_passes = 0  # null window searches of the root made by MTD(f)
+        self.first_move_cutoffs = 0  # cutoffs caused by the first searched child
+        self.elapsed_time = 0.0
+        self._start_time = time.time()
+
+    @property
+    def nodes(self):
+        return sum(self.nodes_per_ply) + self.quiescence_nodes
+
+    @property
+    def first_move_cutoff_rate(self):
+        """
+        :return: share of cutoffs found by the first child - close to 1 means moves are ordered well
+        """
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    @property
+    def effective_branching_factor(self):
+        """
+        :return: growth of nodes between the last two iterations of iterative deepening,
+                 depth-th root of nodes for a single search
+        """
+        if len(self.nodes_per_iteration) >= 2 and self.nodes_per_iteration[-2]:
+            return self.nodes_per_iteration[-1] / self.nodes_per_iteration[-2]
+        return self.nodes ** (1 / self.depth) if self.depth else 0.0
+
+    @property
+    def nodes_per_second(self):
+        return self.nodes / self.elapsed_time if self.elapsed_time > 0 else 0.0
+
+    def count_node(self, ply):
+        if ply < len(self.nodes_per_ply):
+            self.nodes_per_ply[ply] += 1
+        else:
+            self.nodes_per_ply.append(1)
+
+    def merge(self, other, ply_offset=0):
+        """
+        Adds counters of search of a subtree (done by other process) whose root is ply_offset plies deep
+        :return: -
+        """
+        while len(self.nodes_per_ply) < ply_offset + len(other.nodes_per_ply):
+            self.nodes_per_ply.append(0)
+        for ply, nodes in enumerate(other.nodes_per_ply):
+            self.nodes_per_ply[ply + ply_offset] += nodes
+        self.leaf_evaluations += other.leaf_evaluations
+        self.tablebase_hits += other.tablebase_hits
+        self.quiescence_nodes += other.quiescence_nodes
+        self.quiescence_cutoffs += other.quiescence_cutoffs
+        self.quiescence_limit_hits += other.quiescence_limit_hits
+        self.cutoffs += other.cutoffs
+        self.re_searches += other.re_searches
+        self.aspiration_failures += other.aspiration_failures
+        self.mtdf_passes += other.mtdf_passes
+        self.first_move_cutoffs += other.first_move_cutoffs
+
+    def finish(self, value, depth, principal_variation):
+        """
+        Called when the search ends
+        :param principal_variation: list of Move
+        :return: -
+        """
+        self.value = value
+        self.depth = depth
+        self.principal_variation = principal_variation
+        self.elapsed_time = time.time() - self._start_time
+
+    def as_dict(self):
+        """
+        :return: JSON serializable summary (for monitoring)
+        """
+        return {"value": self.value,
+                "depth": self.depth,
+                "nodes": self.nodes,
+                "nodes_per_ply": list(self.nodes_per_ply),
+                "nodes_per_iteration": list(self.nodes_per_iteration),
+                "leaf_evaluations": self.leaf_evaluations,
+                "tablebase_hits": self.tablebase_hits,
+                "quiescence_nodes": self.quiescence_nodes,
+                "quiescence_cutoffs": self.quiescence_cutoffs,
+                "quiescence_limit_hits": self.quiescence_limit_hits,
+                "cutoffs": self.cutoffs,
+                "re_searches": self.re_searches,
+                "aspiration_failures": self.aspiration_failures,
+                "mtdf_passes": self.mtdf_passes,
+                "first_move_cutoff_rate": self.first_move_cutoff_rate,
+                "effective_branching_factor": self.effective_branching_factor,
+                "elapsed_time": self.elapsed_time,
+                "nodes_per_second": self.nodes_per_second,
+                "principal_variation": [str(move) for move in self.principal_variation]}
+
+    def __str__(self):
+        return f"depth={self.depth} value={self.value} nodes={self.nodes} leaves={self.leaf_evaluations} " \
+               f"tablebase_hits={self.tablebase_hits} quiescence_nodes={self.quiescence_nodes} " \
+               f"cutoffs={self.cutoffs} " \
+               f"first_move_cutoffs={self.first_move_cutoff_rate:.1%} " \
+               f"EBF={self.effective_branching_factor:.2f} time [s]: {self.elapsed_time:.3f} " \
+               f"nodes/s={self.nodes_per_second:.0f} PV: {' '.join(str(move) for move in self.principal_variation)}"
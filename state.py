@@ -1,36 +1,114 @@
+from collections import OrderedDict
+
 from board import *
 
 
+class SuccessorCache:
+    """
+    Keeps child states of up to max_states recently expanded states, the least recently used are dropped first
+    """
+
+    def __init__(self, max_states=10000):
+        self.max_states = max_states
+        self._states = OrderedDict()  # id(state) -> state, holding the state keeps its id unique
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, state):
+        """
+        :return: cached list of child states or None
+        """
+        if state._next_states is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._states.move_to_end(id(state))
+        return state._next_states
+
+    def put(self, state, next_states):
+        state._next_states = next_states
+        self._states[id(state)] = state
+        if len(self._states) > self.max_states:
+            _, evicted_state = self._states.popitem(last=False)
+            evicted_state._next_states = None
+
+    def clear(self):
+        for state in self._states.values():
+            state._next_states = None
+        self._states.clear()
+
+    def __str__(self):
+        return f"SuccessorCache states={len(self._states)}/{self.max_states} hits={self.hits} misses={self.misses}"
+
+
 class State:
+    """
+    Node of the search tree. Keeps the position packed into a single int (position_key of the board), the Board
+    itself is kept only while it's needed and re-created from the key on demand.
+    """
+    __slots__ = ("turn", "level", "key", "zobrist_hash", "move", "is_terminal", "next_move", "_value",
+                 "_cached_board", "_board_class", "_next_states")
+
+    successor_cache = None  # SuccessorCache shared by all states, None if children aren't cached
 
     def __init__(self, board):
         self.turn = board.turn
-        # 8 not allowed or empty
+        self.level = board.level
+        # 4 bits per playable cell (square = row * 4 + column // 2):
+        # 0 empty
         # 2 white man
         # 3 white king
         # a black man
         # b black king
-        # self.board_repr = board.board_repr
-        self.level = board.level
+        self.key = board.position_key
+        self.zobrist_hash = board.zobrist_hash
+        self.move = board.last_move  # Move that led to this state
         self.is_terminal = board.did_game_end()
+        self._value = board.balance
         self._cached_board = board
+        self._board_class = type(board)
 
         self.next_move = None
-        self._value = None
+        self._next_states = None  # managed by successor_cache
 
     def reset_level(self):
         self.level = 0
         if self._cached_board is not None:
             self._cached_board.level = 0
 
+    @staticmethod
+    def enable_successor_cache(max_states=10000):
+        """
+        From now on child states are generated at once and kept for up to max_states states
+        :return: the cache
+        """
+        State.successor_cache = SuccessorCache(max_states)
+        return State.successor_cache
+
+    @staticmethod
+    def disable_successor_cache():
+        if State.successor_cache is not None:
+            State.successor_cache.clear()
+        State.successor_cache = None
+
     @property
     def next_states(self):
-        boards = self._board.get_next_boards()
-        result = []
-        for board in boards:
-            new_state = State(board)
-            result.append(new_state)
-        return result
+        """
+        :return: generator creating child states one by one (so iterate over it once), or list of child states
+                 if the successor cache is enabled
+        """
+        cache = State.successor_cache
+        if cache is None:
+            return self._generate_next_states()
+        next_states = cache.get(self)
+        if next_states is None:
+            next_states = list(self._generate_next_states())
+            cache.put(self, next_states)
+        return next_states
+
+    def _generate_next_states(self):
+        for board in self._board.iter_next_boards():
+            yield State(board)
 
     @property
     def balance(self):
@@ -40,20 +118,18 @@ class State:
             else:  # white wins
                 return 1000
 
-        if self._value is None:
-            self._value = self._board.balance
         return self._value
 
     @property
     def _board(self):
         """
-        Cache new Board object (using stored representation) if it doesn't exist
+        Cache new Board object (using stored position key) if it doesn't exist
         :return: Cached or just created Board object
         """
+        if self._cached_board is None:
+            self._cached_board = self._board_class.from_position_key(self.key, self.turn, self.level)
+            self._cached_board.last_move = self.move
         return self._cached_board
-        # if self._cached_board is None:
-        #     self._cached_board = Board(self.board_repr, self.turn)
-        # return self._cached_board
 
     def clean_cached_board(self):
         self._cached_board = None
@@ -0,0 +1,216 @@
+import mmap
+import struct
+import sys
+import time
+from array import array
+from math import comb
+
+from bitboard import *
+
+# Endgame tablebase: exact result of every position with up to max_pieces pieces, one byte per position.
+# Byte 0 - draw, LONG_RESULT - won or lost in more than MAX_DISTANCE plies (not stored, the search has to find it),
+# otherwise byte - 1 is the number of plies to the end of the game with the best play:
+# odd - the side to move wins, even - the side to move loses (0 - it has already lost).
+#
+# Position index: pieces are sorted by square, squares are ranked with the combinatorial number system,
+# piece types (0 white man, 1 white king, 2 black man, 3 black king) make a base 4 number:
+# index = offset[number of pieces] + (rank of squares * 4 ** pieces + types) * 2 + (1 if black is to move)
+
+TABLEBASE_MAGIC = b"CKTB"
+TABLEBASE_HEADER = struct.Struct("<4sBB")  # magic, version, max_pieces
+TABLEBASE_VERSION = 2
+MAX_DISTANCE = 253  # longer distances are stored as LONG_RESULT
+LONG_RESULT = 255
+
+PIECE_TYPES = (0x2, 0x3, 0xa, 0xb)  # piece representation of every piece type
+PIECE_TYPE_CODES = {representation: code for code, representation in enumerate(PIECE_TYPES)}
+NIBBLE_LOW_BITS = int("1" * 32, 16)  # the lowest bit of every nibble of a position key
+
+
+def position_offsets(max_pieces):
+    """
+    :return: offsets[pieces] - index of the first position with that number of pieces, offsets[max_pieces + 1] is
+             the number of all positions
+    """
+    offsets = [0, 0]
+    for pieces in range(1, max_pieces + 1):
+        offsets.append(offsets[-1] + comb(32, pieces) * 4 ** pieces * 2)
+    return offsets
+
+
+def count_pieces_of_position_key(position_key):
+    return ((position_key | position_key >> 1 | position_key >> 2 | position_key >> 3) & NIBBLE_LOW_BITS).bit_count()
+
+
+def position_index(position_key, turn, offsets):
+    """
+    :param position_key: position_key of a board with at most max_pieces pieces
+    :return: index of the position in the tablebase
+    """
+    occupied = (position_key | position_key >> 1 | position_key >> 2 | position_key >> 3) & NIBBLE_LOW_BITS
+    rank = 0
+    types = 0
+    pieces = 0
+    while occupied:
+        lowest = occupied & -occupied
+        shift = lowest.bit_length() - 1
+        pieces += 1
+        rank += comb(shift >> 2, pieces)
+        types = types * 4 + PIECE_TYPE_CODES[(position_key >> shift) & 0xF]
+        occupied ^= lowest
+    return offsets[pieces] + (rank * 4 ** pieces + types) * 2 + (turn == Color.BLACK)
+
+
+def position_at_index(index, offsets):
+    """
+    :return: (position_key, turn) of the position with the index
+    """
+    pieces = 1
+    while offsets[pieces + 1] <= index:
+        pieces += 1
+    index -= offsets[pieces]
+    turn = Color.BLACK if index & 1 else Color.WHITE
+    rank, types = divmod(index >> 1, 4 ** pieces)
+    position_key = 0
+    for piece in range(pieces, 0, -1):  # the highest square first
+        square = piece - 1
+        while comb(square + 1, piece) <= rank:
+            square += 1
+        rank -= comb(square, piece)
+        types, code = divmod(types, 4)
+        position_key |= PIECE_TYPES[code] << (4 * square)
+    return position_key, turn
+
+
+def generate_tablebase(path, max_pieces=3, verbose=True, max_distance=MAX_DISTANCE):
+    """
+    Retrograde analysis of all positions with up to max_pieces pieces:
+    lost terminal positions are known at first, then results are propagated to predecessors in order of distance -
+    a predecessor wins if it can move to a lost position, and loses once all its successors are known to be won.
+    Positions left unknown are draws.
+    :param max_distance: results of positions farther from the end of the game are stored as LONG_RESULT
+                         (at most MAX_DISTANCE)
+    :return: bytearray of results (also saved to the path)
+    """
+    start_time = time.time()
+    offsets = position_offsets(max_pieces)
+    size = offsets[-1]
+
+    # successors of every position (duplicates removed), flattened
+    successor_offsets = array("I", [0])
+    successors = array("I")
+    for index in range(size):
+        position_key, turn = position_at_index(index, offsets)
+        board = BitBoard.from_position_key(position_key, turn)
+        next_turn = Color.BLACK if turn == Color.WHITE else Color.WHITE
+        children = set()
+        for from_square, to_square, captured, _ in board._generate_moves():
+            child_position_key = board._position_after(from_square, to_square, captured)[4]
+            children.add(position_index(child_position_key, next_turn, offsets))
+        successors.extend(children)
+        successor_offsets.append(len(successors))
+    if verbose:
+        print(f"{size} positions, {len(successors)} moves generated in [s]: {time.time() - start_time:.1f}")
+
+    # predecessors - successor lists inverted
+    predecessor_offsets = array("I", [0] * (size + 1))
+    for successor in successors:
+        predecessor_offsets[successor + 1] += 1
+    for index in range(size):
+        predecessor_offsets[index + 1] += predecessor_offsets[index]
+    predecessors = array("I", [0] * len(successors))
+    filled = array("I", predecessor_offsets[:size])
+    for index in range(size):
+        for successor in successors[successor_offsets[index]:successor_offsets[index + 1]]:
+            predecessors[filled[successor]] = index
+            filled[successor] += 1
+    del filled, successors
+
+    results = array("H", [0]) * size  # distance + 1, 0 for unknown - distances aren't limited during the analysis
+    unknown_successors = array("I", (successor_offsets[index + 1] - successor_offsets[index] for index in range(size)))
+    del successor_offsets
+    queue = [index for index in range(size) if unknown_successors[index] == 0]  # no moves - lost
+    for index in queue:
+        results[index] = 1
+    head = 0
+    while head < len(queue):  # positions are queued in order of distance
+        index = queue[head]
+        head += 1
+        distance = results[index] - 1
+        for predecessor in predecessors[predecessor_offsets[index]:predecessor_offsets[index + 1]]:
+            if results[predecessor]:
+                continue
+            if distance % 2 == 0:  # moving to a lost position wins
+                results[predecessor] = distance + 2
+                queue.append(predecessor)
+            else:
+                unknown_successors[predecessor] -= 1
+                if unknown_successors[predecessor] == 0:  # every move leads to a won position
+                    results[predecessor] = distance + 2
+                    queue.append(predecessor)
+
+    results = bytearray(stored if stored <= max_distance + 1 else LONG_RESULT for stored in results)
+    with open(path, "wb") as tablebase_file:
+        tablebase_file.write(TABLEBASE_HEADER.pack(TABLEBASE_MAGIC, TABLEBASE_VERSION, max_pieces))
+        tablebase_file.write(results)
+    if verbose:
+        print(f"tablebase with up to {max_pieces} pieces: {len(queue)} won or lost "
+              f"({results.count(LONG_RESULT)} in more than {max_distance} plies), {size - len(queue)} drawn, "
+              f"saved to {path} in [s]: {time.time() - start_time:.1f}")
+    return results
+
+
+class Tablebase:
+    """
+    Memory-mapped tablebase file made by generate_tablebase
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.max_pieces = TABLEBASE_HEADER.unpack_from(self._data)
+        if magic != TABLEBASE_MAGIC or version != TABLEBASE_VERSION:
+            raise ValueError(f"{path} is not a tablebase file of version {TABLEBASE_VERSION}")
+        self._offsets = position_offsets(self.max_pieces)
+        self.hits = 0
+
+    def close(self):
+        self._data.close()
+        self._file.close()
+
+    def probe_result(self, position_key, turn):
+        """
+        :return: (result, distance in plies to the end of the game): result 1 - side to move wins, -1 - it loses,
+                 0 - draw (distance 0). None if the position has too many pieces or its result is too far
+                 (more than MAX_DISTANCE plies)
+        """
+        if count_pieces_of_position_key(position_key) > self.max_pieces:
+            return None
+        stored = self._data[TABLEBASE_HEADER.size + position_index(position_key, turn, self._offsets)]
+        if stored == 0:
+            return 0, 0
+        if stored == LONG_RESULT:
+            return None
+        distance = stored - 1
+        return (1 if distance % 2 else -1), distance
+
+    def probe(self, position_key, turn):
+        """
+        :return: value of the position in the same scale as State.balance (faster wins are worth more),
+                 None if the position isn't in the tablebase (see probe_result) - it has to be searched
+        """
+        probed = self.probe_result(position_key, turn)
+        if probed is None:
+            return None
+        self.hits += 1
+        result, distance = probed
+        if result == 0:
+            return 0
+        white_wins = (result == 1) == (turn == Color.WHITE)
+        return 1000 - distance if white_wins else distance - 1000
+
+
+if __name__ == '__main__':
+    generate_tablebase(sys.argv[1] if len(sys.argv) > 1 else "tablebase.bin",
+                       int(sys.argv[2]) if len(sys.argv) > 2 else 3)
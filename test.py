@@ -1,4 +1,19 @@
 from game import *
+from perft import *
+from profileReader import ProfileReader
+from tablebase import *
+from opening_book import *
+from tournament import *
+from evaluation import *
+import os
+import tempfile
+import gc
+import json
+import random
+import tracemalloc
+
+# comparisons of search variants by deep searches take seconds each - they run only if SEARCH_BENCHMARK is 1
+RUN_SEARCH_BENCHMARKS = os.environ.get("SEARCH_BENCHMARK") == "1"
 
 
 def print_next_states(state):
@@ -6,8 +21,9 @@ def print_next_states(state):
     Used only for testing
     :return:
     """
-    if state.next_states:
-        for next_state in state.next_states:
+    next_states = list(state.next_states)
+    if next_states:
+        for next_state in next_states:
             print(next_state)
     else:
         print("<There are no next states available>\n")
@@ -259,6 +275,882 @@ def test_becoming_kings():
     print("alpha_beta time [s]: " + f'{end_time - start_time}')
 
 
+def generate_position_corpus(games=20, max_moves=60, seed=0):
+    """
+    Used only for testing
+    Plays random games from the initial position and from hand-made positions of this file
+    :return: list of (board_repr, turn) of every position met
+    """
+    starting_positions = [(INITIAL_BOARD_REPR, Color.WHITE),
+                          ((0x8a8a8a8a, 0xa8a8a8a8, 0x8a8a8a8a, 0x88288888,
+                            0x88888a88, 0x28282828, 0x82828282, 0x28282828), Color.WHITE),
+                          ((0x88888888, 0x88888888, 0x88888888, 0x8888b888,
+                            0x88838888, 0x88888838, 0x82888888, 0x88888888), Color.WHITE),
+                          ((0x88888888, 0x88888888, 0x88888888, 0x8888b888,
+                            0x88838888, 0x88888838, 0x82888888, 0x88888888), Color.BLACK),
+                          ((0x88838888, 0x88888888, 0x88888888, 0x88888888,
+                            0x888a8888, 0x88888888, 0x88888288, 0x88888888), Color.WHITE),
+                          ((0x88888888, 0x28888888, 0x88888888, 0x88888888,
+                            0x88888888, 0x8888a888, 0x88888288, 0x88888888), Color.BLACK)]
+    rng = random.Random(seed)
+    corpus = []
+    for game_number in range(games):
+        board_repr, turn = starting_positions[game_number % len(starting_positions)]
+        board = Board(board_repr, turn)
+        for _ in range(max_moves):
+            corpus.append((board.board_repr, board.turn))
+            if board.did_game_end():
+                break
+            board = rng.choice(board.get_next_boards())
+    return corpus
+
+
+def test_bitboard_generator():
+    print("test_bitboard_generator")
+    corpus = generate_position_corpus()
+    start_time = time.time()
+    for board_repr, turn in corpus:
+        board = Board(board_repr, turn)
+        bit_board = BitBoard(board_repr, turn)
+        expected = sorted((child.board_repr, child.turn.value, child.level) for child in board.get_next_boards())
+        generated = sorted((child.board_repr, child.turn.value, child.level) for child in bit_board.get_next_boards())
+        assert generated == expected, f"different successors of:\n{board}"
+        assert bit_board.did_game_end() == board.did_game_end(), f"different game end of:\n{board}"
+        assert abs(bit_board.balance - board.balance) < 1e-9, f"different balance of:\n{board}"
+        assert bit_board.board_repr == board_repr
+    end_time = time.time()
+    print(f"{len(corpus)} positions are the same for Board and BitBoard")
+    print("comparison time [s]: " + f'{end_time - start_time}')
+
+
+def test_zobrist_hash():
+    print("test_zobrist_hash")
+    for board_repr, turn in generate_position_corpus(games=6):
+        for board in (Board(board_repr, turn), BitBoard(board_repr, turn)):
+            for child in board.get_next_boards():
+                expected = Board(child.board_repr, child.turn).zobrist_hash
+                assert child.zobrist_hash == expected, f"incremental hash differs for:\n{child}"
+    print("incrementally updated hashes are equal to computed ones")
+
+
+def test_transposition_table():
+    print("test_transposition_table")
+    table = TranspositionTable(4)
+    for board_repr, turn in generate_position_corpus(games=6, max_moves=20)[::7]:
+        state = State(Board(board_repr, turn))
+        expected = SearchAlgorithm().alpha_beta(state, 4)
+        result = SearchAlgorithm(table).alpha_beta(State(Board(board_repr, turn)), 4)
+        assert abs(result - expected) < 1e-9, f"{result} != {expected} for:\n{state}"
+    print(table)
+    assert TranspositionTable(0.5).size == 512 * 1024 // ENTRY_SIZE_IN_BYTES  # fraction of a megabyte
+
+
+def test_iterative_deepening():
+    print("test_iterative_deepening")
+    for board_repr, turn in generate_position_corpus(games=6, max_moves=20)[::11]:
+        state = State(BitBoard(board_repr, turn))
+        if state.is_terminal:
+            continue
+        expected = SearchAlgorithm().alpha_beta(State(BitBoard(board_repr, turn)), 5)
+        search_algorithm = SearchAlgorithm()
+        result = search_algorithm.iterative_deepening(state, 5)
+        assert search_algorithm.completed_depth == 5
+        assert abs(result - expected) < 1e-9, f"{result} != {expected}"
+
+    state = State(Board())
+    search_algorithm = SearchAlgorithm()
+    start_time = time.time()
+    search_algorithm.iterative_deepening(state, 20, time_limit=0.5)
+    end_time = time.time()
+    assert state.next_move is not None
+    print(f"completed depth {search_algorithm.completed_depth} in [s]: {end_time - start_time}")
+
+    search_algorithm.iterative_deepening(state, 20, node_limit=1000)
+    assert state.next_move is not None and search_algorithm.nodes <= 1001
+    print(f"completed depth {search_algorithm.completed_depth} within 1000 nodes")
+
+    State.enable_successor_cache()
+    try:  # cached children keep next_move of the aborted iteration unless the whole chain is restored
+        for node_limit in range(1000, 4000, 250):
+            state = State(Board())
+            search_algorithm.iterative_deepening(state, 20, node_limit=node_limit)
+            principal_variation = [move.key for move in search_algorithm.statistics.principal_variation]
+            assert principal_variation == search_algorithm._principal_variation
+            assert len(principal_variation) == search_algorithm.completed_depth
+    finally:
+        State.disable_successor_cache()
+
+
+class IterationTranspositionTable(TranspositionTable):
+    """
+    Used only for testing
+    Forgets all entries whenever the root is probed - every iteration of iterative deepening starts with an empty
+    table, so no entry of a deeper search can be reused
+    """
+
+    def __init__(self, size_in_mb, root_zobrist_hash):
+        super().__init__(size_in_mb)
+        self.root_zobrist_hash = root_zobrist_hash
+
+    def probe(self, zobrist_hash):
+        if zobrist_hash == self.root_zobrist_hash:
+            self.clear()
+        return super().probe(zobrist_hash)
+
+
+def test_move_ordering():
+    print("test_move_ordering")
+    positions = [position for position in generate_position_corpus(games=6, max_moves=30)[::9]
+                 if not BitBoard(*position).did_game_end()]
+    expected_values = [SearchAlgorithm(move_ordering=False).alpha_beta(State(BitBoard(*position)), 6)
+                       for position in positions]
+    for description, transposition_table_size in (("alpha_beta", None), ("iterative_deepening + TT", 4)):
+        nodes = {}
+        for move_ordering in (False, True):
+            nodes[move_ordering] = 0
+            start_time = time.time()
+            for (board_repr, turn), expected in zip(positions, expected_values):
+                state = State(BitBoard(board_repr, turn))
+                table = TranspositionTable(transposition_table_size) if transposition_table_size else None
+                search_algorithm = SearchAlgorithm(table, move_ordering)
+                if table is None:
+                    value = search_algorithm.alpha_beta(state, 6)
+                    assert abs(value - expected) < 1e-9, f"{value} != {expected}"
+                else:
+                    # entries of deeper searches of transposed positions are reused,
+                    # so the value may differ from the fixed-depth one
+                    search_algorithm.iterative_deepening(state, 6)
+                    assert state.next_move is not None
+                    # unless every iteration starts with an empty table
+                    fresh_state = State(BitBoard(board_repr, turn))
+                    fresh_table = IterationTranspositionTable(transposition_table_size, fresh_state.zobrist_hash)
+                    value = SearchAlgorithm(fresh_table, move_ordering).iterative_deepening(fresh_state, 6)
+                    assert abs(value - expected) < 1e-9, f"{value} != {expected}"
+                nodes[move_ordering] += search_algorithm.nodes
+            print(f"{description}: move_ordering={move_ordering} nodes={nodes[move_ordering]} "
+                  f"time [s]: {time.time() - start_time}")
+        print(f"{description}: ordering visits {nodes[True] / nodes[False]:.1%} of nodes")
+
+
+def test_parallel_search():
+    print("test_parallel_search")
+    positions = [position for position in generate_position_corpus(games=6, max_moves=30)[::9]
+                 if not BitBoard(*position).did_game_end()]
+    for split_depth in (1, 2):
+        parallel_search = ParallelSearch(4, split_depth)
+        serial_time = parallel_time = 0.0
+        for board_repr, turn in positions:
+            serial_state = State(BitBoard(board_repr, turn))
+            start_time = time.time()
+            expected = SearchAlgorithm().alpha_beta(serial_state, 6)
+            serial_time += time.time() - start_time
+
+            parallel_state = State(BitBoard(board_repr, turn))
+            start_time = time.time()
+            result = parallel_search.alpha_beta(parallel_state, 6)
+            parallel_time += time.time() - start_time
+
+            assert abs(result - expected) < 1e-9, f"{result} != {expected}"
+            assert parallel_state.next_move.move == serial_state.next_move.move
+        parallel_search.close()
+        print(f"split_depth={split_depth}: serial [s]: {serial_time} parallel [s]: {parallel_time} "
+              f"speedup: {serial_time / parallel_time:.2f} utilization: {parallel_search.last_utilization:.2f}")
+
+    with Game(6, BitBoard, workers=2, measure_speedup=True) as game:
+        game.calculate_next_move()
+        assert game.search_algorithm.speedups == [game.search_algorithm.last_speedup]
+        assert game.search_algorithm.last_speedup > 0
+
+    board_repr, turn = positions[0]
+    parallel_search = ParallelSearch(2)
+    for time_limit, node_limit in ((0.2, None), (None, 2000)):
+        state = State(BitBoard(board_repr, turn))
+        start_time = time.time()
+        parallel_search.iterative_deepening(state, 20, time_limit, node_limit)
+        elapsed_time = time.time() - start_time
+        statistics = parallel_search.statistics
+        print(f"time_limit={time_limit} node_limit={node_limit}: depth={statistics.depth} "
+              f"nodes={statistics.nodes} time [s]: {elapsed_time}")
+        assert statistics.depth < 20 and state.next_move is not None
+        assert time_limit is None or elapsed_time < time_limit + 0.5  # not a whole iteration more
+        assert node_limit is None or statistics.nodes < 2 * node_limit
+        expected_state = State(BitBoard(board_repr, turn))
+        SearchAlgorithm().alpha_beta(expected_state, statistics.depth)
+        assert state.next_move.move == expected_state.next_move.move  # move of the last completed iteration
+    parallel_search.close()
+
+    options = {"quiescence": True, "principal_variation_search": True}
+    parallel_search = ParallelSearch(2, **options)
+    for board_repr, turn in positions[:4]:
+        for depth in (1, 3):
+            serial_state = State(BitBoard(board_repr, turn))
+            expected = SearchAlgorithm(**options).alpha_beta(serial_state, depth)
+            parallel_state = State(BitBoard(board_repr, turn))
+            result = parallel_search.alpha_beta(parallel_state, depth)
+            assert abs(result - expected) < 1e-9, f"{result} != {expected} with {options} at depth {depth}"
+            assert parallel_state.next_move.move == serial_state.next_move.move
+    parallel_search.close()
+    try:
+        Game(4, BitBoard, transposition_table_size_in_mb=1, workers=2, mtdf=True)
+        assert False, "MTD(f) accepted by the parallel search"
+    except ValueError:
+        pass
+
+
+def test_make_unmake_move():
+    print("test_make_unmake_move")
+    for board_repr, turn in generate_position_corpus():
+        for board in (Board(board_repr, turn), BitBoard(board_repr, turn)):
+            next_boards = board.get_next_boards()
+            moves = board.get_legal_moves()
+            assert len(moves) == len(next_boards)
+            for move, next_board in zip(moves, next_boards):
+                record = board.make_move(move)
+                assert board.board_repr == next_board.board_repr, f"{move} made wrong:\n{board}"
+                assert (board.turn, board.level, board.zobrist_hash) == \
+                       (next_board.turn, next_board.level, next_board.zobrist_hash)
+                board.unmake_move(move, record)
+                assert board.board_repr == board_repr, f"{move} reverted wrong:\n{board}"
+                assert board.turn == turn and board.level == 0
+                assert board.zobrist_hash == Board(board_repr, turn).zobrist_hash
+    print("made and reverted moves are correct")
+
+    positions = generate_position_corpus(games=6, max_moves=30)[::9]
+    for board_class in (Board, BitBoard):
+        results = {}
+        for make_unmake in (False, True):
+            states = [State(board_class(board_repr, turn)) for board_repr, turn in positions]
+            start_time = time.time()
+            values = [SearchAlgorithm(make_unmake=make_unmake).alpha_beta(state, 5) for state in states]
+            print(f"{board_class.__name__} make_unmake={make_unmake} time [s]: {time.time() - start_time}")
+            results[make_unmake] = (values, [state.next_move and state.next_move.move for state in states])
+            assert all(state._board.board_repr == board_repr for state, (board_repr, _) in zip(states, positions))
+        assert results[True] == results[False]
+
+
+def test_material_counters():
+    print("test_material_counters")
+    for board_repr, turn in generate_position_corpus(games=6):
+        board = Board(board_repr, turn)
+        for move in board.get_legal_moves():
+            record = board.make_move(move)
+            for changed_board in [board] + board.get_next_boards():
+                for representation in (0x2, 0x3, 0xa, 0xb):
+                    expected = len([piece for piece in changed_board.pieces
+                                    if piece.get_representation() == representation])
+                    assert changed_board.count_pieces(representation) == expected, f"wrong count:\n{changed_board}"
+                assert changed_board.balance == BitBoard(changed_board.board_repr).balance
+            board.unmake_move(move, record)
+    print("counters are equal to counted pieces")
+
+
+def test_lazy_successors():
+    print("test_lazy_successors")
+    for board_repr, turn in generate_position_corpus(games=6):
+        for board_class in (Board, BitBoard):
+            board = board_class(board_repr, turn)
+            expected = [(child.board_repr, child.turn, child.level) for child in board.get_next_boards()]
+            assert [(child.board_repr, child.turn, child.level) for child in board.iter_next_boards()] == expected
+            state = State(board)
+            assert [state._board.board_repr for state in state.next_states] == [child[0] for child in expected]
+
+    positions = generate_position_corpus(games=6, max_moves=30)[::9]
+    results = {}
+    for successor_cache_size in (None, 100000):
+        if successor_cache_size is not None:
+            State.enable_successor_cache(successor_cache_size)
+        states = [State(Board(board_repr, turn)) for board_repr, turn in positions]
+        start_time = time.time()
+        results[successor_cache_size] = [SearchAlgorithm().iterative_deepening(state, 5) for state in states]
+        print(f"successor_cache_size={successor_cache_size} time [s]: {time.time() - start_time} "
+              f"{State.successor_cache}")
+        State.disable_successor_cache()
+    assert results[None] == results[100000]
+
+
+def test_state_memory():
+    print("test_state_memory")
+    positions = generate_position_corpus(games=6)
+    for board_class in (Board, BitBoard):
+        for board_repr, turn in positions:
+            state = State(board_class(board_repr, turn, 3))
+            state.clean_cached_board()
+            board = state._board
+            assert board.board_repr == board_repr and board.turn == turn and board.level == 3
+            assert board.zobrist_hash == Board(board_repr, turn).zobrist_hash
+
+        for keep_boards in (True, False):
+            tracemalloc.start()
+            states = []
+            for board_repr, turn in positions:
+                state = State(board_class(board_repr, turn))
+                if not keep_boards:
+                    state.clean_cached_board()
+                states.append(state)
+            gc.collect()  # pieces reference their board - dropped boards are freed by the garbage collector
+            memory, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{board_class.__name__} {'with board' if keep_boards else 'key only'}: "
+                  f"{memory // len(states)} B per state")
+
+
+def test_tree_reuse():
+    print("test_tree_reuse")
+    game = Game(6, BitBoard, transposition_table_size_in_mb=4)
+    positions = []
+    warm_nodes = 0
+    warm_values = []
+    start_time = time.time()
+    while game.moves_made < 30 and not game.is_finished():
+        positions.append((game.current_state.key, game.current_state.turn))
+        warm_values.append(game.search_algorithm.alpha_beta(game.current_state, game.depth))
+        warm_nodes += game.search_algorithm.nodes
+        game.make_move()
+    print(f"warm searches: nodes={warm_nodes} time [s]: {time.time() - start_time}")
+
+    cold_nodes = 0
+    cold_values = []
+    start_time = time.time()
+    for key, turn in positions:
+        search_algorithm = SearchAlgorithm(TranspositionTable(4))
+        cold_values.append(search_algorithm.alpha_beta(State(BitBoard.from_position_key(key, turn)), game.depth))
+        cold_nodes += search_algorithm.nodes
+    print(f"cold searches: nodes={cold_nodes} time [s]: {time.time() - start_time}")
+    assert warm_values == cold_values
+
+
+def test_perft():
+    print("test_perft")
+    for board_class in (Board, BitBoard):
+        for generator in GENERATORS:
+            run_perft_suite(board_class, generator)
+    board = Board(*PERFT_POSITIONS["multi_jump"][:2])
+    for move, count in perft_divide(board, 3):
+        print(f"{move}: {count}")
+
+
+def test_search_statistics():
+    print("test_search_statistics")
+    positions = generate_position_corpus(games=6, max_moves=30)[::9]
+    for board_repr, turn in positions:
+        search_algorithm = SearchAlgorithm(TranspositionTable(4))
+        state = State(BitBoard(board_repr, turn))
+        value = search_algorithm.iterative_deepening(state, 5)
+        statistics = search_algorithm.statistics
+        print(statistics)
+        assert statistics.value == value and statistics.depth == search_algorithm.completed_depth
+        assert statistics.nodes == search_algorithm.nodes == sum(statistics.nodes_per_iteration)
+        assert statistics.first_move_cutoffs <= statistics.cutoffs
+        assert [move.key for move in statistics.principal_variation] == \
+               SearchAlgorithm._get_principal_variation(state)
+        json.dumps(statistics.as_dict())
+
+    with Game(4, BitBoard, workers=2, split_depth=2) as game:
+        statistics = game.calculate_next_move()
+        assert statistics.nodes == sum(statistics.nodes_per_ply) and len(statistics.nodes_per_ply) == 5
+        assert statistics.principal_variation[0] == game.current_state.next_move.move
+
+
+def test_profiling():
+    print("test_profiling")
+    with tempfile.TemporaryDirectory() as directory:
+        ProfileReader.run_workload("test_board", depth=4, directory=directory)
+        ProfileReader.run_workload("test_bitboard", depth=4, board_class=BitBoard, make_unmake=True,
+                                   directory=directory)
+        assert Board.balance.fget.__name__ == "balance"  # phase timers are removed after the run
+        ProfileReader.print_diff("test_board", "test_bitboard", limit=10, directory=directory)
+
+
+def test_tablebase():
+    print("test_tablebase")
+    path = os.path.join(tempfile.mkdtemp(), "tablebase.bin")
+    generate_tablebase(path, 2)
+    tablebase = Tablebase(path)
+    offsets = position_offsets(2)
+    rng = random.Random(0)
+    for index in rng.sample(range(offsets[-1]), 2000):
+        position_key, turn = position_at_index(index, offsets)
+        assert position_index(position_key, turn, offsets) == index
+        board = BitBoard.from_position_key(position_key, turn)
+        result, distance = tablebase.probe_result(position_key, turn)
+        children = [tablebase.probe_result(child.position_key, child.turn) for child in board.get_next_boards()]
+        if result == 1:  # the best move leads to a position lost in one ply less
+            assert min(child_distance for child_result, child_distance in children if child_result == -1) \
+                   == distance - 1
+        elif result == -1:
+            assert all(child_result == 1 for child_result, _ in children)
+            assert max(child_distance for _, child_distance in children) == distance - 1 if children else distance == 0
+        else:
+            assert children and all(child_result != -1 for child_result, _ in children)
+    print("results agree with results of successors")
+
+    short_path = os.path.join(tempfile.mkdtemp(), "short_tablebase.bin")
+    generate_tablebase(short_path, 2, max_distance=3)
+    short_tablebase = Tablebase(short_path)
+    for index in rng.sample(range(offsets[-1]), 2000):
+        position_key, turn = position_at_index(index, offsets)
+        probed = tablebase.probe_result(position_key, turn)
+        if probed[1] > 3:  # too far - not claimed to be a draw, the search has to find the result
+            assert short_tablebase.probe_result(position_key, turn) is None
+            assert short_tablebase.probe(position_key, turn) is None
+        else:
+            assert short_tablebase.probe_result(position_key, turn) == probed
+    short_tablebase.close()
+
+    for board_repr, turn in [((0x88888888, 0x88888888, 0x88888888, 0x8888b888,
+                               0x88838888, 0x88888888, 0x88888888, 0x88888888), Color.WHITE),
+                             ((0x88888888, 0x28888888, 0x88888888, 0x88888888,
+                               0x88888888, 0x8888a888, 0x88888288, 0x88888888), Color.BLACK)]:
+        for search_algorithm in (SearchAlgorithm(), SearchAlgorithm(tablebase=tablebase)):
+            state = State(BitBoard(board_repr, turn))
+            start_time = time.time()
+            value = search_algorithm.alpha_beta(state, 6)
+            print(f"tablebase={search_algorithm.tablebase is not None} value={value} time [s]: "
+                  f"{time.time() - start_time} {search_algorithm.statistics}")
+        if count_pieces_of_position_key(state.key) <= 2:
+            result, distance = tablebase.probe_result(state.key, state.turn)
+            assert value == tablebase.probe(state.next_move.key, state.next_move.turn)
+            assert result != 1 or tablebase.probe_result(state.next_move.key, state.next_move.turn) == (-1, distance - 1)
+    tablebase.close()
+
+
+def test_opening_book():
+    print("test_opening_book")
+    path = os.path.join(tempfile.mkdtemp(), "opening_book.bin")
+    stored = generate_opening_book(path, plies=3, depth=5)
+    book = OpeningBook(path)
+    assert book.size == stored
+    for board in [Board()] + Board().get_next_boards():
+        move, value = book.find_move(board)
+        state = State(board)
+        assert value == SearchAlgorithm(TranspositionTable(16)).iterative_deepening(state, 5)
+    assert book.probe(0) is None
+
+    # the king captures between the same cells over 1 or 4 pieces - the book plays the stored one
+    board = BitBoard((0x88888888, 0x88888888, 0x888a8a88, 0xa8888888, 0x888a8888, 0x88883888, 0x888a8888, 0x88888888))
+    variants = [move for move in board.get_legal_moves() if str(move) == "(5, 4)->(7, 2)"]
+    assert len(variants) == 2 and variants[0].cells_key == variants[1].cells_key
+    assert variants[0].key != variants[1].key and variants[0] != variants[1]
+    table = TranspositionTable(1)
+    state = State(board)
+    SearchAlgorithm(table).iterative_deepening(state, 3)  # the hash move names one of the variants
+    assert table.probe(board.zobrist_hash)[3] == state.next_move.move.key
+    assert [move.key for move in board.get_legal_moves()].count(state.next_move.move.key) == 1
+    for variant in variants:
+        variant_path = os.path.join(tempfile.mkdtemp(), "variant_book.bin")
+        with open(variant_path, "wb") as book_file:
+            book_file.write(OPENING_BOOK_HEADER.pack(OPENING_BOOK_MAGIC, OPENING_BOOK_VERSION, 1))
+            book_file.write(OPENING_BOOK_RECORD.pack(board.zobrist_hash, variant.cells_key,
+                                                     captured_squares(variant), 0))
+        variant_book = OpeningBook(variant_path)
+        move, _ = variant_book.find_move(board)
+        assert move.captured == variant.captured
+        variant_book.close()
+
+    for opening_book_path in (None, path):
+        with Game(5, opening_book_path=opening_book_path) as game:
+            start_time = time.time()
+            moves = []
+            for _ in range(4):
+                game.calculate_next_move()
+                moves.append(game.current_state.next_move.move)
+                game.make_move()
+        print(f"opening_book={opening_book_path is not None} moves: {' '.join(str(move) for move in moves)} "
+              f"time [s]: {time.time() - start_time}")
+    print(game.opening_book)
+    book.close()
+
+
+def test_tournament():
+    print("test_tournament")
+    path = os.path.join(tempfile.mkdtemp(), "results.jsonl")
+    config_a = {"name": "depth 1", "depth": 1}
+    config_b = {"name": "depth 3", "depth": 3, "transposition_table_size_in_mb": 1}
+    run_tournament(path, config_a, config_b, games=4, workers=2, random_plies=2, max_plies=60)
+    with open(path) as results_file:
+        lines = results_file.readlines()
+    with open(path, "w") as results_file:  # the last game was interrupted while being stored
+        results_file.writelines(lines[:-1] + [lines[-1][:20]])
+    scores = run_tournament(path, config_a, config_b, games=6, workers=2, random_plies=2, max_plies=60)
+    games = [json.loads(line) for line in open(path)]
+    assert sorted(game["game"] for game in games) == list(range(6)) and sum(scores.values()) == 6
+    assert all(len(game["moves"]) == len(game["move_times"]) == len(game["nodes"]) == game["plies"] for game in games)
+    assert play_game(1, config_a, config_b, 4, 60)["moves"] == play_game(1, config_a, config_b, 4, 60)["moves"]
+    try:  # resumed with other configs - the scores would mix results of different engines
+        run_tournament(path, config_a, dict(config_b, depth=2), games=8, workers=2)
+        assert False, "resumed with other config"
+    except ValueError:
+        pass
+    try:  # resumed with other settings - games wouldn't be the same as in one run
+        run_tournament(path, config_a, config_b, games=8, workers=2, random_plies=2, max_plies=60, seed=1)
+        assert False, "resumed with other seed"
+    except ValueError:
+        pass
+    scores = run_tournament(path, config_a, config_b, games=4, workers=2, random_plies=2, max_plies=60)
+    assert sum(scores.values()) == 4  # games 4 and 5 are stored but aren't part of this tournament
+
+
+def test_batch_evaluation():
+    print("test_batch_evaluation")
+    from batch_evaluation import evaluate_corpus, evaluate_position_keys  # requires NumPy
+    position_keys = [BitBoard(board_repr, turn).position_key for board_repr, turn in generate_position_corpus()]
+    start_time = time.time()
+    expected = [BitBoard.from_position_key(position_key).balance for position_key in position_keys]
+    print(f"{len(position_keys)} positions one by one [s]: {time.time() - start_time}")
+    start_time = time.time()
+    values = evaluate_corpus(position_keys, batch_size=100)
+    print(f"{len(position_keys)} positions in batches [s]: {time.time() - start_time}")
+    assert list(values) == expected and list(evaluate_position_keys(position_keys)) == expected
+
+    positions = generate_position_corpus(games=6, max_moves=30)[::9]
+    for board_class in (Board, BitBoard):
+        for make_unmake in (False, True):
+            results = {}
+            for batch_evaluation in (False, True):
+                search_algorithm = SearchAlgorithm(TranspositionTable(4), make_unmake=make_unmake,
+                                                   batch_evaluation=batch_evaluation)
+                states = [State(board_class(board_repr, turn)) for board_repr, turn in positions]
+                start_time = time.time()
+                values = [search_algorithm.iterative_deepening(state, 5) for state in states]
+                print(f"{board_class.__name__} make_unmake={make_unmake} batch_evaluation={batch_evaluation} "
+                      f"time [s]: {time.time() - start_time}")
+                results[batch_evaluation] = (values, [SearchAlgorithm._get_principal_variation(state)
+                                                      for state in states])
+            assert results[True] == results[False]
+
+    path = os.path.join(tempfile.mkdtemp(), "tablebase.bin")
+    generate_tablebase(path, 2, verbose=False)
+    tablebase = Tablebase(path)
+    rng = random.Random(0)
+    for _ in range(60):  # 3 pieces: leaves after a capture are in the tablebase
+        squares = rng.sample(range(32), 3)
+        position_key = sum(representation << (4 * square) for representation, square in
+                           zip((rng.choice((0x2, 0x3)), rng.choice((0xa, 0xb)), rng.choice((0x2, 0x3, 0xa, 0xb))),
+                               squares))
+        turn = rng.choice((Color.WHITE, Color.BLACK))
+        for depth in (1, 2, 3):
+            results = []
+            for batch_evaluation in (False, True):
+                search_algorithm = SearchAlgorithm(tablebase=tablebase, batch_evaluation=batch_evaluation)
+                state = State(BitBoard.from_position_key(position_key, turn))
+                results.append((search_algorithm.alpha_beta(state, depth), search_algorithm.nodes,
+                                search_algorithm.statistics.tablebase_hits))
+            assert results[0] == results[1], f"{results} at depth {depth}:\n{state}"
+    tablebase.close()
+
+
+def test_evaluation():
+    print("test_evaluation")
+    assert Board().balance == BitBoard().balance == 0  # the initial position is symmetric
+    positions = generate_position_corpus(games=6)
+    for board_class in (Board, BitBoard):
+        for board_repr, turn in positions:
+            board = board_class(board_repr, turn)
+            balance = board.balance
+            for move in board.get_legal_moves():
+                record = board.make_move(move)
+                expected = board_class.from_position_key(board.position_key, board.turn).balance
+                assert board.balance == expected, f"incremental {board.balance} != {expected}:\n{board}"
+                board.unmake_move(move, record)
+                assert board.balance == balance
+            for next_board in board.get_next_boards():
+                assert next_board.balance == board_class.from_position_key(next_board.position_key).balance
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "weights.json")
+        for invalid in ({"tempo": 1.5}, {"mobility": 1}, {"piece_square_tables": {"king": [0] * 31}},
+                        {"piece_square_tables": {"queen": [0] * 32}}, [1, 2]):
+            with open(path, "w") as weights_file:
+                json.dump(invalid, weights_file)
+            try:
+                load_weights(path)
+                assert False, f"{invalid} accepted"
+            except ValueError:
+                pass
+        with open(path, "w") as weights_file:
+            json.dump({"tempo": 5, "edge": 0, "piece_square_tables": {"king": list(range(32))}}, weights_file)
+        weights = load_weights(path)
+        assert weights["tempo"] == 5 and weights["center"] == DEFAULT_WEIGHTS["center"]
+        default_balances = [BitBoard(board_repr, turn).balance for board_repr, turn in positions]
+        try:
+            set_weights(weights)  # board of the loop above is still alive
+            assert False, "weights changed under an existing board"
+        except ValueError:
+            pass
+        set_weights(DEFAULT_WEIGHTS)  # the same weights - nothing changes
+        del board, next_board
+        set_weights(weights)
+        try:
+            balances = [BitBoard(board_repr, turn).balance for board_repr, turn in positions]
+            assert balances != default_balances
+            assert balances == [Board(board_repr, turn).balance for board_repr, turn in positions]
+        finally:
+            set_weights(DEFAULT_WEIGHTS)
+        with Game(1, BitBoard):
+            try:
+                Game(1, BitBoard, evaluation_weights_path=path)
+                assert False, "game with other weights started while another game exists"
+            except ValueError:
+                pass
+    print("incremental evaluation is equal to evaluation from scratch")
+
+
+def search_benchmark_positions():
+    """
+    Used only for testing
+    :return: list of (board_repr, turn) of not finished positions from the middle of games
+    """
+    return [position for position in generate_position_corpus(games=6, max_moves=40)[::6]
+            if not BitBoard(*position).did_game_end()]
+
+
+def test_quiescence():
+    print("test_quiescence")
+    positions = search_benchmark_positions()
+    for board_repr, turn in positions[::2]:
+        expected = SearchAlgorithm().alpha_beta(State(BitBoard(board_repr, turn)), 3)
+        search_algorithm = SearchAlgorithm(quiescence=True, quiescence_node_limit=0)
+        assert search_algorithm.alpha_beta(State(BitBoard(board_repr, turn)), 3) == expected  # nothing to extend
+        values = []
+        for board_class in (Board, BitBoard):
+            for make_unmake in (False, True):
+                search_algorithm = SearchAlgorithm(TranspositionTable(4), make_unmake=make_unmake, quiescence=True)
+                values.append(search_algorithm.iterative_deepening(State(board_class(board_repr, turn)), 3))
+                statistics = search_algorithm.statistics
+                assert statistics.nodes == search_algorithm.nodes == sum(statistics.nodes_per_iteration)
+        assert len(set(values)) == 1, values
+    if RUN_SEARCH_BENCHMARKS:
+        benchmark_quiescence(positions)
+
+
+def benchmark_quiescence(positions):
+    """
+    Distance from the value of a deep search: quiescence should get close to one more ply of the main search
+    """
+    print("benchmark_quiescence")
+    references = [SearchAlgorithm(TranspositionTable(16), quiescence=True).iterative_deepening(
+        State(BitBoard(board_repr, turn)), 8) for board_repr, turn in positions]
+    for depth, quiescence in ((3, False), (3, True), (4, False), (4, True), (5, False)):
+        error = 0
+        nodes = 0
+        start_time = time.time()
+        for (board_repr, turn), reference in zip(positions, references):
+            search_algorithm = SearchAlgorithm(TranspositionTable(4), quiescence=quiescence)
+            value = search_algorithm.iterative_deepening(State(BitBoard(board_repr, turn)), depth)
+            error += min(abs(value - reference), 10)
+            nodes += search_algorithm.nodes
+        print(f"depth={depth} quiescence={quiescence} mean error={error / len(positions):.3f} nodes={nodes} "
+              f"time [s]: {time.time() - start_time}")
+
+
+def test_principal_variation_search():
+    print("test_principal_variation_search")
+    positions = search_benchmark_positions()
+    for board_repr, turn in positions[::2]:
+        expected = SearchAlgorithm().alpha_beta(State(BitBoard(board_repr, turn)), 4)
+        for search_algorithm in (SearchAlgorithm(principal_variation_search=True),
+                                 SearchAlgorithm(principal_variation_search=True, aspiration_window=0.25)):
+            value = search_algorithm.iterative_deepening(State(BitBoard(board_repr, turn)), 4)
+            assert abs(value - expected) < 1e-9, f"{value} != {expected}"
+    if RUN_SEARCH_BENCHMARKS:
+        benchmark_principal_variation_search(positions)
+
+
+def benchmark_principal_variation_search(positions):
+    """
+    Nodes, re-searches and time of the full window search, aspiration windows and PVS at depth 7
+    """
+    print("benchmark_principal_variation_search")
+    configurations = (("alpha_beta", {}),
+                      ("alpha_beta + aspiration", {"aspiration_window": 0.25}),
+                      ("PVS", {"principal_variation_search": True}),
+                      ("PVS + aspiration", {"principal_variation_search": True, "aspiration_window": 0.25}))
+    for description, parameters in configurations:
+        nodes = 0
+        re_searches = 0
+        aspiration_failures = 0
+        start_time = time.time()
+        for board_repr, turn in positions:
+            search_algorithm = SearchAlgorithm(TranspositionTable(4), **parameters)
+            search_algorithm.iterative_deepening(State(BitBoard(board_repr, turn)), 7)
+            nodes += search_algorithm.nodes
+            re_searches += search_algorithm.statistics.re_searches
+            aspiration_failures += search_algorithm.statistics.aspiration_failures
+        print(f"{description}: nodes={nodes} re-searches={re_searches} aspiration failures={aspiration_failures} "
+              f"time [s]: {time.time() - start_time}")
+
+
+def test_mtdf():
+    print("test_mtdf")
+    positions = search_benchmark_positions()
+    for board_repr, turn in positions[::2]:
+        expected = SearchAlgorithm().alpha_beta(State(BitBoard(board_repr, turn)), 4)
+        state = State(BitBoard(board_repr, turn))
+        value = SearchAlgorithm(TranspositionTable(4), mtdf=True).alpha_beta(state, 4)
+        assert value == expected, f"{value} != {expected}"
+        assert SearchAlgorithm().alpha_beta(state.next_move, 3) == value  # the chosen move is the best one
+    if RUN_SEARCH_BENCHMARKS:
+        benchmark_mtdf(positions)
+
+
+def benchmark_mtdf(positions):
+    """
+    Nodes per second and move latency of both drivers on the same positions
+    """
+    print("benchmark_mtdf")
+    for description, mtdf in (("alpha_beta", False), ("MTD(f)", True)):
+        nodes = 0
+        latencies = []
+        for board_repr, turn in positions:
+            search_algorithm = SearchAlgorithm(TranspositionTable(4), mtdf=mtdf)
+            start_time = time.time()
+            search_algorithm.iterative_deepening(State(BitBoard(board_repr, turn)), 7)
+            latencies.append(time.time() - start_time)
+            nodes += search_algorithm.nodes
+        print(f"{description}: nodes={nodes} nodes/s={nodes / sum(latencies):.0f} "
+              f"mean move time [s]: {sum(latencies) / len(latencies):.4f} max: {max(latencies):.4f}")
+
+
+def test_unique_attacks():
+    print("test_unique_attacks")
+    multi_jump_repr, multi_jump_turn, _ = PERFT_POSITIONS["multi_jump"]
+    for board_class in (Board, BitBoard):
+        moves = board_class(multi_jump_repr, multi_jump_turn).get_legal_moves()
+        assert len(moves) == 1 and moves[0].captured_count == len(moves[0].path) == len(moves[0].captured) == 5
+        for board_repr, turn in generate_position_corpus(games=6):
+            board = board_class(board_repr, turn)
+            position_keys = [next_board.position_key for next_board in board.get_next_boards()]
+            assert len(position_keys) == len(set(position_keys)), f"the same position generated twice:\n{board}"
+            for move in board.get_legal_moves():
+                assert len(move.path) == len(move.captured) == move.captured_count and \
+                       (not move.path or move.path[-1] == move.end)
+    print("every position is generated once")
+
+
+def test_piece_tables():
+    print("test_piece_tables")
+    rng = random.Random(0)
+    pieces = 0
+    start_time = time.time()
+    for _ in range(1000):
+        position_key = 0
+        for square in range(32):
+            if rng.random() < 0.25:
+                position_key |= rng.choice((0x2, 0x3, 0xa, 0xb)) << (4 * square)
+        board = Board.from_position_key(position_key)
+        for piece in board.pieces:
+            # every cell on diagonals of the piece checked one by one, nearest first
+            cells = [(piece.row + delta_row * distance, piece.column + delta_column * distance)
+                     for distance in range(1, 8) for delta_row, delta_column in DIRECTIONS]
+            cells = [(row, column) for row, column in cells if is_allowed_cell_on_board(row, column)]
+            if isinstance(piece, King):
+                moves = [cell for cell in cells if piece._can_move_to(*cell)]
+                attacks = [cell for cell in cells if piece._can_attack_to(*cell)]
+            else:
+                forward = -1 if piece.color == Color.WHITE else 1
+                moves = [(row, column) for row, column in cells
+                         if row - piece.row == forward and piece._can_move_to(row, column)]
+                moves.sort()
+                attacks = [(row, column) for row, column in cells
+                           if abs(row - piece.row) == 2 and piece._can_attack_to(row, column)]
+                attacks.sort(key=lambda cell: (cell[0] - piece.row, cell[1] - piece.column))
+            assert piece.possible_moves == moves, f"{piece.row, piece.column}:\n{board}"
+            assert piece.possible_attacks == attacks, f"{piece.row, piece.column}:\n{board}"
+            pieces += 1
+    print(f"moves of {pieces} pieces are equal to checked cells, time [s]: {time.time() - start_time}")
+
+    # kings-only endgame - where generation spends the most time on long rays
+    board = BitBoard.from_position_key((0x3 << 4 * 5) | (0x3 << 4 * 26) | (0xb << 4 * 9) | (0xb << 4 * 30))
+    board = Board(board.board_repr)
+    start_time = time.time()
+    count = perft(board, 5)
+    print(f"kings endgame perft(5)={count} time [s]: {time.time() - start_time}")
+
+
+def test_legal_move_cache():
+    print("test_legal_move_cache")
+    for board_class in (Board, BitBoard):
+        for board_repr, turn in generate_position_corpus(games=6):
+            board = board_class(board_repr, turn)
+            moves = [str(move) for move in board.get_legal_moves()]
+            assert board.get_legal_moves() is board.get_legal_moves()  # generated once
+            assert board.did_game_end() == (not moves)
+            for move in board.get_legal_moves():
+                record = board.make_move(move)
+                fresh = board_class.from_position_key(board.position_key, board.turn)
+                assert [str(child) for child in board.get_legal_moves()] == \
+                       [str(child) for child in fresh.get_legal_moves()]
+                assert board.did_game_end() == fresh.did_game_end()
+                board.unmake_move(move, record)
+                assert [str(parent) for parent in board.get_legal_moves()] == moves
+    board = Board()
+    board.get_legal_moves()
+    board.delete_piece_at(5, 0)  # the cache is dropped when a piece is removed
+    assert [str(move) for move in board.get_legal_moves()] == \
+           [str(move) for move in Board(board.board_repr).get_legal_moves()]
+    print("cached moves are equal to generated ones")
+
+
+def test_codec():
+    print("test_codec")
+    from position_codec import encode_position, decode_position, encode_board, decode_board, encode_positions, \
+        decode_positions, POSITION_SIZE
+    positions = generate_position_corpus()
+    for board_repr, turn in positions:
+        board = Board(board_repr, turn)
+        assert board.board_repr == board_repr and BitBoard(board_repr, turn).board_repr == board_repr
+        assert position_key_from_board_repr(board_repr) == board.position_key
+        assert board_repr_from_position_key(board.position_key) == board_repr
+        code = encode_board(board)
+        assert code < 1 << (8 * POSITION_SIZE) and decode_position(code) == (board.position_key, turn)
+        for board_class in (Board, BitBoard):
+            decoded = decode_board(code, board_class)
+            assert decoded.board_repr == board_repr and decoded.zobrist_hash == board.zobrist_hash
+    assert encode_position(0, Color.WHITE) == 0 and decode_position(1 << 80) == (0, Color.BLACK)
+    for bad_position_key in (0x1, 0x8 << 124):
+        try:
+            encode_position(bad_position_key, Color.WHITE)
+            assert False, "not a position_key"
+        except ValueError:
+            pass
+
+    position_keys = [(BitBoard(board_repr, turn).position_key, turn) for board_repr, turn in positions] * 20
+    start_time = time.time()
+    data = encode_positions(position_keys)
+    print(f"{len(position_keys)} positions encoded to {len(data)} bytes [s]: {time.time() - start_time}")
+    start_time = time.time()
+    assert decode_positions(data) == position_keys
+    print(f"{len(position_keys)} positions decoded [s]: {time.time() - start_time}")
+
+    from position_codec import decode_array, encode_array  # requires NumPy
+    from batch_evaluation import pack_position_keys, evaluate_batch
+    start_time = time.time()
+    packed, turns = decode_array(data)
+    print(f"{len(position_keys)} positions decoded to arrays [s]: {time.time() - start_time}")
+    assert (packed == pack_position_keys(position_key for position_key, _ in position_keys)).all()
+    assert list(turns) == [turn.value for _, turn in position_keys]
+    assert encode_array(packed, turns) == data
+    assert list(evaluate_batch(packed[:100])) == [BitBoard.from_position_key(position_key).balance
+                                                  for position_key, _ in position_keys[:100]]
+
+
+def test_draw_rules():
+    print("test_draw_rules")
+    with Game(4, BitBoard) as game:  # self-play of the same engine repeats positions once only kings are left
+        while not game.is_finished():
+            game.calculate_next_move()
+            game.make_move()
+    print(f"game finished after {game.moves_made} plies, draw={game.is_draw()}")
+    assert game.current_state.is_terminal or game.is_draw()
+    assert max(game.position_counts.values()) <= DRAW_REPETITIONS
+    assert game.plies_without_progress <= DRAW_PLIES_WITHOUT_PROGRESS
+    try:
+        game.make_move()
+        assert False, "move made in a finished game"
+    except RuntimeError:
+        pass
+
+
 if __name__ == '__main__':
     # test_repr_gen()
     # test_man_moves()
@@ -271,3 +1163,33 @@ if __name__ == '__main__':
     # test_alpha_beta()
     # test_kings()
     test_becoming_kings()
+    # test_bitboard_generator()
+    # test_zobrist_hash()
+    # test_transposition_table()
+    # test_iterative_deepening()
+    # test_move_ordering()
+    # test_parallel_search()
+    # test_make_unmake_move()
+    # test_material_counters()
+    # test_lazy_successors()
+    # test_state_memory()
+    # test_tree_reuse()
+    # test_perft()
+    # test_search_statistics()
+    # test_profiling()
+    # test_tablebase()
+    # test_opening_book()
+    # test_tournament()
+    # test_batch_evaluation()
+    # test_evaluation()
+    # test_quiescence()
+    # test_principal_variation_search()
+    # test_mtdf()
+    # test_unique_attacks()
+    # test_piece_tables()
+    # test_legal_move_cache()
+    # test_codec()
+    # test_draw_rules()
+    # benchmark_quiescence(search_benchmark_positions())
+    # benchmark_principal_variation_search(search_benchmark_positions())
+    # benchmark_mtdf(search_benchmark_positions())
@@ -0,0 +1,203 @@
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from bitboard import BitBoard
+from search_algorithm import *
+from tablebase import Tablebase
+
+# Engine-vs-engine games without any user input. Every finished game is appended to a JSONL file as one line,
+# games already present in the file are skipped, so an interrupted tournament is continued by running it again.
+
+BOARD_CLASSES = {"board": Board, "bitboard": BitBoard}
+DEFAULT_CONFIG = {"name": None, "depth": 4, "board": "bitboard", "transposition_table_size_in_mb": None,
+                  "make_unmake": False, "time_limit": None, "node_limit": None, "tablebase_path": None,
+                  "quiescence": False, "principal_variation_search": False, "aspiration_window": None,
+                  "mtdf": False}
+
+
+class Player:
+    """
+    One side of the game: search algorithm set up by a config (see DEFAULT_CONFIG)
+    """
+
+    def __init__(self, config):
+        self.config = dict(DEFAULT_CONFIG, **config)
+        self.board_class = BOARD_CLASSES[self.config["board"]]
+        table = TranspositionTable(self.config["transposition_table_size_in_mb"]) \
+            if self.config["transposition_table_size_in_mb"] is not None else None
+        tablebase = Tablebase(self.config["tablebase_path"]) if self.config["tablebase_path"] is not None else None
+        self.search_algorithm = SearchAlgorithm(table, make_unmake=self.config["make_unmake"], tablebase=tablebase,
+                                                quiescence=self.config["quiescence"],
+                                                principal_variation_search=self.config["principal_variation_search"],
+                                                aspiration_window=self.config["aspiration_window"],
+                                                mtdf=self.config["mtdf"])
+
+    def choose_move(self, position_key, turn):
+        """
+        :return: Move chosen by the search
+        """
+        state = State(self.board_class.from_position_key(position_key, turn))
+        if self.config["time_limit"] is None and self.config["node_limit"] is None:
+            self.search_algorithm.alpha_beta(state, self.config["depth"])
+        else:
+            self.search_algorithm.iterative_deepening(state, self.config["depth"], self.config["time_limit"],
+                                                      self.config["node_limit"])
+        return state.next_move.move
+
+
+def play_game(game_number, white_config, black_config, random_plies=0, max_plies=200, seed=0):
+    """
+    Runs in worker process
+    :param random_plies: number of random moves the game starts with (the same ones for the same seed and game)
+    :param max_plies: the game is drawn if it doesn't end after that many moves of both sides
+    :return: dict describing the game (one line of the results file)
+    """
+    players = {Color.WHITE: Player(white_config), Color.BLACK: Player(black_config)}
+    rng = random.Random(f"{seed}:{game_number}")
+    board = BitBoard()
+    moves = []
+    move_times = []
+    nodes = []
+    start_time = time.time()
+    while not board.did_game_end() and len(moves) < max_plies:
+        if len(moves) < random_plies:
+            move = rng.choice(board.get_legal_moves())
+            move_times.append(0.0)
+            nodes.append(0)
+        else:
+            player = players[board.turn]
+            move_start_time = time.time()
+            move = player.choose_move(board.position_key, board.turn)
+            move_times.append(time.time() - move_start_time)
+            nodes.append(player.search_algorithm.nodes)
+        for player in players.values():
+            player.search_algorithm.advance(move)
+        board.make_move(move)
+        moves.append(str(move))
+
+    if not board.did_game_end():
+        result = "draw"
+    else:  # the side to move has lost
+        result = "black" if board.turn == Color.WHITE else "white"
+    return {"game": game_number,
+            "white": players[Color.WHITE].config["name"],
+            "black": players[Color.BLACK].config["name"],
+            "result": result,
+            "plies": len(moves),
+            "random_plies": random_plies,  # the game settings are stored for checks when the tournament resumes
+            "max_plies": max_plies,
+            "seed": seed,
+            "moves": moves,
+            "move_times": move_times,
+            "nodes": nodes,
+            "balance": board.balance,
+            "time": time.time() - start_time,
+            "white_config": players[Color.WHITE].config,
+            "black_config": players[Color.BLACK].config}
+
+
+def finished_games(results_path):
+    """
+    Drops the last line of the results file if it was cut by interruption
+    :return: {game number: game} of games already stored in the results file
+    """
+    if not os.path.exists(results_path):
+        return {}
+    with open(results_path) as results_file:
+        content = results_file.read()
+    if content and not content.endswith("\n"):
+        content = content[:content.rfind("\n") + 1]
+        with open(results_path, "w") as results_file:
+            results_file.write(content)
+    games = [json.loads(line) for line in content.splitlines()]
+    return {game["game"]: game for game in games}
+
+
+def run_tournament(results_path, config_a, config_b, games=100, workers=None, random_plies=0, max_plies=200,
+                   seed=0):
+    """
+    Plays games between two configs, they swap colors every game (config_a is white in even games)
+    :raise ValueError: if the results file contains games played with other configs or settings
+    :return: {config name or "draw": number of results} of games 0 .. games - 1
+    """
+    config_a = dict(DEFAULT_CONFIG, **config_a)
+    config_b = dict(DEFAULT_CONFIG, **config_b)
+    if config_a["name"] is None:
+        config_a["name"] = "a"
+    if config_b["name"] is None:
+        config_b["name"] = "b"
+    settings = {"random_plies": random_plies, "max_plies": max_plies, "seed": seed}
+    done = finished_games(results_path)
+    for game_number, game in done.items():
+        white_config, black_config = (config_a, config_b) if game_number % 2 == 0 else (config_b, config_a)
+        if game.get("white_config") != white_config or game.get("black_config") != black_config:
+            raise ValueError(f"game {game_number} in {results_path} was played with other configs, "
+                             f"use another results file")
+        if any(game.get(name) != value for name, value in settings.items()):
+            raise ValueError(f"game {game_number} in {results_path} was played with other settings than "
+                             f"{settings}, use another results file")
+    if done:
+        print(f"resuming: {len(done)} games already played")
+
+    with open(results_path, "a") as results_file, ProcessPoolExecutor(workers) as executor:
+        futures = []
+        for game_number in range(games):
+            if game_number in done:
+                continue
+            white_config, black_config = (config_a, config_b) if game_number % 2 == 0 else (config_b, config_a)
+            futures.append(executor.submit(play_game, game_number, white_config, black_config, random_plies,
+                                           max_plies, seed))
+        for future in as_completed(futures):
+            game = future.result()
+            results_file.write(json.dumps(game) + "\n")
+            results_file.flush()  # stored as soon as finished - survives interruption
+            print(f"game {game['game']}: {game['white']} vs {game['black']} -> {game['result']} "
+                  f"in {game['plies']} plies")
+
+    scores = {config_a["name"]: 0, config_b["name"]: 0, "draw": 0}
+    for game_number, game in finished_games(results_path).items():
+        if game_number < games:  # a longer tournament could have been stored in the file before
+            scores[game[game["result"]] if game["result"] != "draw" else "draw"] += 1
+    print(f"results: {scores}")
+    return scores
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plays engine-vs-engine games and streams results to JSONL file")
+    parser.add_argument("results_path")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--random-plies", type=int, default=0)
+    parser.add_argument("--max-plies", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    for side in ("a", "b"):
+        parser.add_argument(f"--{side}-depth", type=int, default=4)
+        parser.add_argument(f"--{side}-board", choices=list(BOARD_CLASSES), default="bitboard")
+        parser.add_argument(f"--{side}-tt", type=int, default=None, help="transposition table size in MB")
+        parser.add_argument(f"--{side}-time-limit", type=float, default=None)
+        parser.add_argument(f"--{side}-node-limit", type=int, default=None)
+        parser.add_argument(f"--{side}-quiescence", action="store_true")
+        parser.add_argument(f"--{side}-pvs", action="store_true", help="principal variation search")
+        parser.add_argument(f"--{side}-aspiration-window", type=float, default=None)
+        parser.add_argument(f"--{side}-mtdf", action="store_true", help="MTD(f), requires --tt")
+    arguments = vars(parser.parse_args())
+    configs = [{"name": f"{side}: depth {arguments[side + '_depth']}",
+                "depth": arguments[side + "_depth"],
+                "board": arguments[side + "_board"],
+                "transposition_table_size_in_mb": arguments[side + "_tt"],
+                "time_limit": arguments[side + "_time_limit"],
+                "node_limit": arguments[side + "_node_limit"],
+                "quiescence": arguments[side + "_quiescence"],
+                "principal_variation_search": arguments[side + "_pvs"],
+                "aspiration_window": arguments[side + "_aspiration_window"],
+                "mtdf": arguments[side + "_mtdf"]} for side in ("a", "b")]
+    run_tournament(arguments["results_path"], configs[0], configs[1], arguments["games"], arguments["workers"],
+                   arguments["random_plies"], arguments["max_plies"], arguments["seed"])
+
+
+if __name__ == '__main__':
+    main()
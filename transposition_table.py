@@ -0,0 +1,80 @@
+EXACT = 0
+LOWER_BOUND = 1  # real value >= stored value (search failed high)
+UPPER_BOUND = 2  # real value <= stored value (search failed low)
+
+# approximate size of one stored entry: tuple of 6 + hash int + float + list slot
+ENTRY_SIZE_IN_BYTES = 200
+
+
+class TranspositionTable:
+    """
+    Remembers results of already searched positions, indexed by Zobrist hash (position + side to move).
+    Fixed number of slots derived from the memory cap. When two positions share a slot the deeper result wins,
+    but results left by previous searches (older age) are always replaced.
+    """
+
+    def __init__(self, size_in_mb=16):
+        self.size = max(1, int(size_in_mb * 1024 * 1024) // ENTRY_SIZE_IN_BYTES)
+        self._entries = [None] * self.size
+        self.age = 0
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    def new_search(self):
+        """
+        Marks entries stored so far as old, so they're replaced first
+        :return: -
+        """
+        self.age += 1
+
+    def probe(self, zobrist_hash):
+        """
+        :return: (depth, value, bound, best_move_key) or None if the position isn't stored
+        """
+        entry = self._entries[zobrist_hash % self.size]
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] != zobrist_hash:  # other position occupies the slot
+            self.collisions += 1
+            return None
+        self.hits += 1
+        return entry[1:5]
+
+    def store(self, zobrist_hash, depth, value, bound, best_move_key):
+        """
+        :param depth: remaining depth the value was searched with
+        :param bound: EXACT, LOWER_BOUND or UPPER_BOUND
+        :param best_move_key: Move.key of the best (or refuting) move, None if unknown
+        :return: -
+        """
+        index = zobrist_hash % self.size
+        entry = self._entries[index]
+        if entry is not None:
+            if entry[5] == self.age and entry[2] > depth:
+                return  # keep deeper result of the current search
+            self.overwrites += 1
+        self._entries[index] = (zobrist_hash, depth, value, bound, best_move_key, self.age)
+        self.stores += 1
+
+    def clear(self):
+        self._entries = [None] * self.size
+        self.age = 0
+        self.hits = self.misses = self.collisions = self.stores = self.overwrites = 0
+
+    @property
+    def filled(self):
+        """
+        :return: Number of used slots
+        """
+        return sum(1 for entry in self._entries if entry is not None)
+
+    def __str__(self):
+        probes = self.hits + self.misses + self.collisions
+        hit_rate = self.hits / probes if probes else 0.0
+        return f"TT slots={self.size} filled={self.filled} probes={probes} hits={self.hits} " \
+               f"misses={self.misses} collisions={self.collisions} hit_rate={hit_rate:.1%} " \
+               f"stores={self.stores} overwrites={self.overwrites}"
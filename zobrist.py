@@ -0,0 +1,20 @@
+import random
+
+# Zobrist hashing: every (piece, square) pair gets a random 64-bit key, the hash of a position is XOR of keys
+# of all pieces standing on it (and of the side key if black is to move). Moving a piece updates the hash
+# with two XORs, so boards keep it up to date instead of recomputing it.
+# Squares are numbered like in bitboard.py: square = row * 4 + column // 2
+
+_random = random.Random(0x5eed)  # fixed seed - hashes have to be equal between runs and processes
+
+ZOBRIST_PIECE_KEYS = {representation: tuple(_random.getrandbits(64) for _ in range(32))
+                      for representation in (0x2, 0x3, 0xa, 0xb)}
+ZOBRIST_BLACK_TO_MOVE = _random.getrandbits(64)
+
+
+def zobrist_key(representation, row, column):
+    """
+    :param representation: piece representation (2 white man, 3 white king, a black man, b black king)
+    :return: key of that piece standing on the cell
+    """
+    return ZOBRIST_PIECE_KEYS[representation][row * 4 + column // 2]